@@ -0,0 +1,68 @@
+# allocator_check.py — scenario checks for pick_unique_amount on the in-memory Mongo fake
+# Usage: python bench/allocator_check.py
+# Each scenario seeds live locks across two payees, runs the allocator and checks the rule from
+# main.py's header: integers first, decimals only when no payee has a free integer left.
+# Exits non-zero on the first failed check.
+
+import os, sys, random
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import main
+from fakes import FakeDB
+
+PAYEES = [
+    {"id": "a", "upi_id": "a@upi", "name": "A", "notif_channel_id": -1},
+    {"id": "b", "upi_id": "b@upi", "name": "B", "notif_channel_id": -2},
+]
+
+def fresh(locks: dict):
+    # locks: payee -> amount keys held live
+    main.set_db(FakeDB())
+    main.migrate()
+    main.PAYEES.clear()
+    main.PAYEES.update({p["id"]: p for p in PAYEES})
+    exp = datetime.utcnow() + timedelta(minutes=5)
+    for payee, keys in locks.items():
+        for k in keys:
+            main.c_locks.insert_one({"payee": payee, "amount_key": k, "amount": float(k),
+                                     "hard_expire_at": exp, "created_at": datetime.utcnow()})
+    return exp + timedelta(minutes=1)
+
+def check(name: str, ok: bool, got):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}: {got}")
+    if not ok:
+        sys.exit(1)
+
+def main_():
+    ints = [str(v) for v in range(10, 21)]
+
+    # A: 10 of 11 integers + 5 decimals (15 locks); B: all 11 integers. B is less loaded,
+    # but only A has a free integer, so A must get it rather than B a decimal.
+    for seed in range(20):
+        random.seed(seed)
+        exp = fresh({"a": ints[:-1] + [f"10.0{i}" for i in range(1, 6)], "b": ints})
+        got = main.pick_unique_amount(10, 20, exp)
+        check(f"integer on the busier payee (seed {seed})", got == ("a", 20.0), got)
+
+    # Free integers on both: the less-loaded payee wins.
+    exp = fresh({"a": ints[:5], "b": ints[:2]})
+    got = main.pick_unique_amount(10, 20, exp)
+    check("least-loaded payee", got is not None and got[0] == "b" and got[1] == int(got[1]), got)
+
+    # No integer free anywhere: a decimal, on the least-loaded payee.
+    exp = fresh({"a": ints + ["10.01", "10.02"], "b": ints})
+    got = main.pick_unique_amount(10, 20, exp)
+    check("decimal only when integers are exhausted", got is not None and got[0] == "b" and got[1] != int(got[1]), got)
+
+    # Everything held on every payee: None.
+    every = ints + [f"{b}.{p:02d}" for b in range(10, 21) for p in range(1, 100)]
+    exp = fresh({"a": every, "b": every})
+    got = main.pick_unique_amount(10, 20, exp)
+    check("exhausted", got is None, got)
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,79 @@
+# bench_parser.py — PhonePe notification parser: correctness on the corpus + throughput
+# Usage: python bench/bench_parser.py [--seconds 2]
+# Compares the original per-character parser (inlined below as the baseline)
+# against phonepe_parser, on every message shape in phonepe_corpus.jsonl.
+
+import os, sys, json, time, re, argparse, unicodedata
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from phonepe_parser import parse_payment_amount
+
+# ---- baseline: gate + parse as on_channel_post used to do it ----
+def _normalize_digits(s: str) -> str:
+    out = []
+    for ch in s:
+        if unicodedata.category(ch).startswith('M'):
+            continue
+        if ch.isdigit():
+            try:
+                out.append(str(unicodedata.digit(ch)))
+                continue
+            except Exception:
+                pass
+        out.append(ch)
+    return "".join(out)
+
+PHONEPE_RE = re.compile(
+    r"(?:received\s*rs|you['’]ve\s*received\s*rs)\s*[.:₹\s]*([0-9][0-9,]*(?:\.[0-9]{1,2})?)",
+    re.I | re.S
+)
+
+def baseline(text: str):
+    low = text.lower()
+    if ("phonepe business" not in low) or (("received rs" not in low) and ("money received" not in low)):
+        return None
+    m = PHONEPE_RE.search(_normalize_digits(text or ""))
+    if not m:
+        return None
+    try:
+        return float(m.group(1).replace(",", ""))
+    except Exception:
+        return None
+
+def load_corpus():
+    with open(os.path.join(HERE, "phonepe_corpus.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def throughput(fn, texts, seconds: float) -> float:
+    n, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for t in texts:
+            fn(t)
+        n += len(texts)
+    return n / (time.perf_counter() - start)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+
+    corpus = load_corpus()
+    bad = 0
+    for row in corpus:
+        got = parse_payment_amount(row["text"])
+        if got != row["amount"]:
+            bad += 1
+            print(f"MISMATCH want={row['amount']} got={got}: {row['text']!r}")
+    print(f"corpus: {len(corpus)} messages, {bad} mismatches")
+
+    texts = [r["text"] for r in corpus]
+    before = throughput(baseline, texts, args.seconds)
+    after = throughput(parse_payment_amount, texts, args.seconds)
+    print(f"baseline : {before:12,.0f} msg/s")
+    print(f"parser   : {after:12,.0f} msg/s  ({after / before:.1f}x)")
+    sys.exit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# fakes.py — in-memory stand-ins for the load test: a Mongo database and a Telegram Bot
+# FakeDB covers exactly the pymongo surface main.py uses (CRUD, find-and-modify, bulk_write,
+# unique indexes, dotted $set paths); every operation can carry a simulated round-trip latency.
+# FakeBot records each Bot API call per method and sleeps a configurable latency.
+
+import time, copy, itertools, threading
+from collections import Counter
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+
+_MISSING = object()
+
+def _get(doc, path):
+    cur = doc
+    for part in path.split("."):
+        if isinstance(cur, list) and part.isdigit():
+            i = int(part)
+            cur = cur[i] if i < len(cur) else _MISSING
+        elif isinstance(cur, dict):
+            cur = cur.get(part, _MISSING)
+        else:
+            return _MISSING
+        if cur is _MISSING:
+            return _MISSING
+    return cur
+
+def _set(doc, path, value):
+    parts = path.split(".")
+    cur = doc
+    for p in parts[:-1]:
+        cur = cur[int(p)] if isinstance(cur, list) else cur.setdefault(p, {})
+    if isinstance(cur, list):
+        cur[int(parts[-1])] = value
+    else:
+        cur[parts[-1]] = value
+
+def _cmp(val, op, arg):
+    if val is _MISSING or val is None:
+        return False
+    try:
+        return {"$gt": val > arg, "$gte": val >= arg, "$lt": val < arg, "$lte": val <= arg}[op]
+    except TypeError:
+        return False
+
+def _match_value(val, cond):
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                ok = _cmp(val, op, arg)
+            elif op == "$in":
+                ok = (None if val is _MISSING else val) in arg
+            elif op == "$ne":
+                ok = (None if val is _MISSING else val) != arg
+            elif op == "$exists":
+                ok = (val is not _MISSING) == bool(arg)
+            else:
+                raise NotImplementedError(op)
+            if not ok:
+                return False
+        return True
+    return (None if val is _MISSING else val) == cond
+
+def _matches(doc, flt):
+    for k, cond in (flt or {}).items():
+        if k == "$or":
+            if not any(_matches(doc, f) for f in cond):
+                return False
+        elif k == "$and":
+            if not all(_matches(doc, f) for f in cond):
+                return False
+        elif not _match_value(_get(doc, k), cond):
+            return False
+    return True
+
+def _project(doc, proj):
+    doc = copy.deepcopy(doc)
+    if not proj:
+        return doc
+    keep = [k for k, v in proj.items() if v and k != "_id"]
+    if keep:
+        out = {k: doc[k] for k in keep if k in doc}
+        if proj.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    for k, v in proj.items():
+        if not v:
+            doc.pop(k, None)
+    return doc
+
+def _sort_key(spec):
+    def key(doc):
+        out = []
+        for field, direction in spec:
+            v = _get(doc, field)
+            v = (0, None) if v is _MISSING or v is None else (1, v)
+            out.append(v if direction > 0 else _Desc(v))
+        return out
+    return key
+
+class _Desc:
+    def __init__(self, v):
+        self.v = v
+    def __lt__(self, other):
+        return other.v < self.v
+    def __eq__(self, other):
+        return self.v == other.v
+
+def _norm_sort(key, direction=None):
+    if isinstance(key, str):
+        return [(key, direction or 1)]
+    return list(key)
+
+class FakeCursor:
+    def __init__(self, docs, proj):
+        self._docs = docs
+        self._proj = proj
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        self._docs.sort(key=_sort_key(_norm_sort(key, direction)))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def __iter__(self):
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        return (_project(d, self._proj) for d in docs)
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self._docs = []
+        self._unique = {}  # index name -> [fields]
+        self._indexes = {"_id_": [("_id", 1)]}
+
+    def _rtt(self):
+        if self.db.latency:
+            time.sleep(self.db.latency)
+
+    def _dup(self, doc, skip=None):
+        for fields in self._unique.values():
+            key = tuple(None if _get(doc, f) is _MISSING else _get(doc, f) for f in fields)
+            for d in self._docs:
+                if d is not skip and tuple(None if _get(d, f) is _MISSING else _get(d, f) for f in fields) == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key {self.name} {dict(zip(fields, key))}")
+
+    # --- indexes ---
+    def create_index(self, keys, unique=False, **kw):
+        name = "_".join(f"{f}_{d}" for f, d in keys)
+        self._indexes[name] = list(keys)
+        if unique:
+            self._unique[name] = [f for f, _ in keys]
+        return name
+
+    def index_information(self):
+        return {n: {"key": k} for n, k in self._indexes.items()}
+
+    def drop_index(self, name):
+        self._indexes.pop(name, None)
+        self._unique.pop(name, None)
+
+    def watch(self, *a, **k):
+        raise OperationFailure("change streams are not supported by FakeDB")
+
+    # --- writes (caller holds db.lock) ---
+    def _insert(self, doc):
+        doc.setdefault("_id", ObjectId())
+        stored = copy.deepcopy(doc)
+        self._dup(stored)
+        self._docs.append(stored)
+        return doc["_id"]
+
+    def _apply(self, doc, update, inserting):
+        for op, fields in update.items():
+            for k, v in fields.items():
+                if op == "$set" or (op == "$setOnInsert" and inserting):
+                    _set(doc, k, copy.deepcopy(v))
+                elif op == "$inc":
+                    cur = _get(doc, k)
+                    _set(doc, k, (0 if cur is _MISSING else cur) + v)
+                elif op == "$unset":
+                    doc.pop(k, None)
+                elif op != "$setOnInsert":
+                    raise NotImplementedError(op)
+
+    def _update(self, flt, update, upsert=False, many=False, sort=None, return_after=False):
+        hits = [d for d in self._docs if _matches(d, flt)]
+        if sort:
+            hits.sort(key=_sort_key(_norm_sort(sort)))
+        if not hits:
+            if not upsert:
+                return None, 0, None
+            doc = {k: v for k, v in flt.items() if not k.startswith("$") and not isinstance(v, dict)}
+            self._apply(doc, update, True)
+            self._insert(doc)
+            return (doc if return_after else None), 0, doc["_id"]
+        targets = hits if many else hits[:1]
+        before = None
+        for d in targets:
+            before = copy.deepcopy(d)
+            new = copy.deepcopy(d)
+            self._apply(new, update, False)
+            self._dup(new, skip=d)
+            d.clear()
+            d.update(new)
+        return (targets[0] if return_after else before), len(targets), None
+
+    # --- public API ---
+    def insert_one(self, doc):
+        self._rtt()
+        with self.db.lock:
+            return SimpleNamespace(inserted_id=self._insert(doc))
+
+    def insert_many(self, docs, ordered=True):
+        return self.bulk_write([InsertOne(d) for d in docs], ordered=ordered)
+
+    def update_one(self, flt, update, upsert=False):
+        self._rtt()
+        with self.db.lock:
+            _, n, uid = self._update(flt, update, upsert)
+        return SimpleNamespace(matched_count=n, modified_count=n, upserted_id=uid)
+
+    def update_many(self, flt, update, upsert=False):
+        self._rtt()
+        with self.db.lock:
+            _, n, uid = self._update(flt, update, upsert, many=True)
+        return SimpleNamespace(matched_count=n, modified_count=n, upserted_id=uid)
+
+    def find_one_and_update(self, flt, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE):
+        self._rtt()
+        with self.db.lock:
+            doc, _, _ = self._update(flt, update, upsert, sort=sort, return_after=bool(return_document))
+            return _project(doc, projection) if doc is not None else None
+
+    def delete_one(self, flt):
+        self._rtt()
+        with self.db.lock:
+            for i, d in enumerate(self._docs):
+                if _matches(d, flt):
+                    del self._docs[i]
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, flt):
+        self._rtt()
+        with self.db.lock:
+            keep = [d for d in self._docs if not _matches(d, flt)]
+            n = len(self._docs) - len(keep)
+            self._docs = keep
+        return SimpleNamespace(deleted_count=n)
+
+    def find_one_and_delete(self, flt, sort=None):
+        self._rtt()
+        with self.db.lock:
+            hits = [d for d in self._docs if _matches(d, flt)]
+            if sort:
+                hits.sort(key=_sort_key(_norm_sort(sort)))
+            if not hits:
+                return None
+            self._docs.remove(hits[0])
+            return copy.deepcopy(hits[0])
+
+    def find(self, flt=None, projection=None):
+        self._rtt()
+        with self.db.lock:
+            return FakeCursor([copy.deepcopy(d) for d in self._docs if _matches(d, flt)], projection)
+
+    def find_one(self, flt=None, projection=None):
+        for d in self.find(flt, projection).limit(1):
+            return d
+        return None
+
+    def count_documents(self, flt):
+        self._rtt()
+        with self.db.lock:
+            return sum(1 for d in self._docs if _matches(d, flt))
+
+    def estimated_document_count(self):
+        self._rtt()
+        return len(self._docs)
+
+    def bulk_write(self, ops, ordered=True):
+        self._rtt()
+        errors = []
+        with self.db.lock:
+            for i, op in enumerate(ops):
+                try:
+                    if isinstance(op, InsertOne):
+                        self._insert(op._doc)
+                    elif isinstance(op, UpdateOne):
+                        self._update(op._filter, op._doc, op._upsert)
+                    else:
+                        raise NotImplementedError(type(op).__name__)
+                except DuplicateKeyError as e:
+                    errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+        return SimpleNamespace(acknowledged=True)
+
+class FakeDB:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.lock = threading.RLock()
+        self._colls = {}
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self._colls:
+                self._colls[name] = FakeCollection(self, name)
+            return self._colls[name]
+
+class FakeBot:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.username = "loadtest_bot"
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _call(self, method, chat_id=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[method] += 1
+            mid = next(self._ids)
+        return SimpleNamespace(message_id=mid, chat_id=chat_id,
+                               photo=[SimpleNamespace(file_id=f"photo-{mid}")])
+
+    def send_message(self, chat_id, text=None, **kw):
+        return self._call("sendMessage", chat_id)
+
+    def send_photo(self, chat_id, photo=None, **kw):
+        return self._call("sendPhoto", chat_id)
+
+    def copy_message(self, chat_id, from_chat_id=None, message_id=None, **kw):
+        return self._call("copyMessage", chat_id)
+
+    def send_media_group(self, chat_id, media=None, **kw):
+        return [self._call("sendMediaGroup", chat_id)]
+
+    def edit_message_text(self, text=None, chat_id=None, message_id=None, **kw):
+        return self._call("editMessageText", chat_id)
+
+    def get_chat_member(self, chat_id, user_id):
+        self._call("getChatMember", chat_id)
+        return SimpleNamespace(status="member")
+
+    def get_chat(self, chat_id):
+        self._call("getChat", chat_id)
+        return SimpleNamespace(title=f"chat {chat_id}", invite_link=f"https://t.me/+{abs(chat_id)}")
+
+    def export_chat_invite_link(self, chat_id):
+        self._call("exportChatInviteLink", chat_id)
+        return f"https://t.me/+{abs(chat_id)}"
+
+class FakeJobQueue:
+    def __init__(self):
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def run_once(self, callback, when, context=None, name=None):
+        with self._lock:
+            self.jobs.append((callback, when, context, name))
+
+    def run_repeating(self, callback, interval, first=None, context=None, name=None):
+        self.run_once(callback, first, context, name)
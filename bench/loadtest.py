@@ -0,0 +1,140 @@
+# loadtest.py — end-to-end load test on fake Telegram + in-memory Mongo backends
+# Usage: python bench/loadtest.py [--buyers 200] [--concurrency 32] [--price 10-20] [--files 5]
+#            [--mongo-ms 0] [--bot-ms 20] [--api-rate 25] [--bc-users 500]
+# Runs N buyers through /start <item_id> -> start_purchase -> PhonePe channel post -> deliver,
+# then one broadcast, and reports checkout latency percentiles, payment-match throughput,
+# amount-allocator contention, delivery latency and broadcast send rate.
+# --mongo-ms simulates the Atlas round trip per operation; --api-rate is the global Bot API
+# budget (Telegram's real limit is ~30/s, raise it to measure the bot rather than the limit).
+
+import os, sys, time, argparse
+from datetime import datetime
+from types import SimpleNamespace as NS
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import main
+import metrics
+from fakes import FakeDB, FakeBot, FakeJobQueue
+
+def pct(xs, p):
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+def ms(xs):
+    return "p50 {:7.1f}  p95 {:7.1f}  p99 {:7.1f}  max {:7.1f} ms".format(
+        *(pct(xs, p) * 1000 for p in (50, 95, 99)), max(xs or [0]) * 1000)
+
+def timed_call(fn, *a):
+    t0 = time.perf_counter()
+    fn(*a)
+    return time.perf_counter() - t0
+
+def setup(args):
+    main.set_db(FakeDB(args.mongo_ms))
+    main.migrate()
+    main.api_limiter = main.RateLimiter(args.api_rate)
+    main.chat_limiter = main.ChatRateLimiter(main.PER_CHAT_INTERVAL)
+    main.SLOW_OP_MS = None
+    bot = FakeBot(args.bot_ms)
+    lo, _, hi = args.price.partition("-")
+    item_id = "item_loadtest"
+    main.c_products.insert_one({
+        "item_id": item_id, "min_price": float(lo), "max_price": float(hi or lo),
+        "files": [{"channel_id": -100, "message_id": i, "type": "document", "file_id": f"doc-{i}"}
+                  for i in range(args.files)],
+    })
+    return bot, item_id
+
+def checkout(bot, jq, item_id, uid):
+    update = NS(effective_user=NS(id=uid, username=f"user{uid}"), message=NS(chat_id=uid),
+                callback_query=None, effective_message=None)
+    ctx = NS(bot=bot, args=[item_id], job_queue=jq, user_data={})
+    return timed_call(main.cmd_start, update, ctx)
+
+def pay(bot, jq, sess, n):
+    post = NS(chat_id=main.PAYEES[sess["payee"]]["notif_channel_id"], message_id=n,
+              text=f"PhonePe Business\nReceived Rs {sess['amount_key']} from LOAD TEST",
+              caption=None, date=datetime.utcnow())
+    return timed_call(main.on_channel_post, NS(channel_post=post), NS(bot=bot, job_queue=jq))
+
+def run(args):
+    bot, item_id = setup(args)
+    jq = FakeJobQueue()
+    print(f"buyers={args.buyers} concurrency={args.concurrency} price={args.price} files={args.files} "
+          f"mongo={args.mongo_ms}ms bot={args.bot_ms}ms api-rate={args.api_rate}/s")
+
+    # 1. checkouts
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        lat = list(pool.map(lambda uid: checkout(bot, jq, item_id, uid), range(1, args.buyers + 1)))
+    wall = time.perf_counter() - t0
+    print(f"\ncheckout   {len(lat)} in {wall:.2f}s ({len(lat) / wall:,.0f}/s)\n           {ms(lat)}")
+    picks = {k: metrics.counter_value("allocator_picks_total", kind=k) for k in ("integer", "decimal", "exhausted")}
+    print(f"allocator  integer {picks['integer']:.0f}  decimal {picks['decimal']:.0f}  "
+          f"exhausted {picks['exhausted']:.0f}  races {metrics.counter_value('allocator_races_total'):.0f}")
+
+    # 2. payment notifications
+    sessions = main.open_sessions.all()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        lat = list(pool.map(lambda p: pay(bot, jq, p[1], p[0]), enumerate(sessions, 1)))
+    wall = time.perf_counter() - t0
+    queued = main.c_delivs.count_documents({})
+    print(f"\nmatch      {len(lat)} notifications in {wall:.2f}s ({len(lat) / max(wall, 1e-9):,.0f}/s), "
+          f"{queued} deliveries queued\n           {ms(lat)}")
+
+    # 3. deliveries
+    t0 = time.perf_counter()
+    main.start_delivery_workers(bot)
+    main._deliv_wakeup.set()
+    while main.c_delivs.count_documents({"status": {"$in": ["done", "failed"]}}) < queued:
+        if time.perf_counter() - t0 > args.timeout:
+            print("deliveries timed out")
+            break
+        time.sleep(0.05)
+    wall = time.perf_counter() - t0
+    done = [d for d in main.c_delivs.find({"status": "done"})]
+    p2d = [(d["updated_at"] - d["paid_at"]).total_seconds() for d in done]
+    print(f"\ndelivery   {len(done)}/{queued} done in {wall:.2f}s ({len(done) / max(wall, 1e-9):,.1f} orders/s)\n"
+          f"           payment->delivery {ms(p2d)}")
+
+    # 4. broadcast
+    main.c_users.bulk_write([main.UpdateOne({"user_id": 10_000_000 + i}, {"$set": {"username": ""}}, upsert=True)
+                             for i in range(args.bc_users)])
+    users = main.c_users.count_documents({})
+    job_id = main.c_bcjobs.insert_one({
+        "files": [], "text": "load test", "cursor": None, "ok": 0, "fail": 0, "status": "running",
+        "admin_chat_id": 1, "progress_msg_id": 1, "heartbeat": datetime.utcnow(), "created_at": datetime.utcnow(),
+    }).inserted_id
+    sent_before = bot.calls["sendMessage"]
+    t0 = time.perf_counter()
+    main.run_broadcast(bot, job_id)
+    wall = time.perf_counter() - t0
+    job = main.c_bcjobs.find_one({"_id": job_id})
+    sent = bot.calls["sendMessage"] - sent_before
+    print(f"\nbroadcast  {users} users, ok {job['ok']} fail {job['fail']} in {wall:.2f}s ({sent / wall:,.1f} msg/s)")
+
+    main.write_behind.flush()
+    print("\nbot api    " + "  ".join(f"{k} {v}" for k, v in sorted(bot.calls.items())))
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--buyers", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--price", default="10-20")
+    ap.add_argument("--files", type=int, default=5)
+    ap.add_argument("--mongo-ms", type=float, default=0.0)
+    ap.add_argument("--bot-ms", type=float, default=20.0)
+    ap.add_argument("--api-rate", type=float, default=25.0)
+    ap.add_argument("--bc-users", type=int, default=500)
+    ap.add_argument("--timeout", type=float, default=300.0)
+    run(ap.parse_args())
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,115 @@
+# webhook_replay.py — post captured Telegram updates to the bot's local webhook server
+# Usage: python bench/webhook_replay.py --url http://127.0.0.1:8443/tg/<secret> \
+#            [--file bench/updates_sample.jsonl] [--repeat 200] [--concurrency 8] \
+#            [--metrics http://127.0.0.1:9108/metrics]
+# Each update gets a fresh update_id / message_id / date so the bot treats it as new.
+# Reports request latency (time for PTB to accept the update onto the dispatcher queue) and,
+# from the bot's update_lag_seconds metric, update-to-handler lag for the replayed channel posts:
+# the same metric the bot records under real polling/webhook traffic, so the modes compare directly.
+# Dates have 1s resolution; the lag mean is corrected by the sub-second part each post's date lost.
+# Don't point this at a bot whose payment channel is live: replayed channel posts are matched
+# against real sessions.
+
+import os, sys, json, time, copy, argparse, itertools, threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+_ids = itertools.count(int(time.time()))
+_ids_lock = threading.Lock()
+
+# Returns the fresh update and how far its (whole-second) date lags the real send time
+def freshen(update: dict) -> tuple:
+    u = copy.deepcopy(update)
+    with _ids_lock:
+        n = next(_ids)
+    u["update_id"] = n
+    now = time.time()
+    for kind in ("message", "channel_post", "edited_message", "edited_channel_post"):
+        if kind in u:
+            u[kind]["message_id"] = n
+            u[kind]["date"] = int(now)
+    return u, now - int(now)
+
+# -> (request seconds, date truncation seconds, or None when the bot won't time it)
+def post(url: str, update: dict) -> tuple:
+    fresh, trunc = freshen(update)
+    body = json.dumps(fresh).encode()
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=10) as r:
+        r.read()
+    return time.perf_counter() - t0, trunc if "channel_post" in fresh else None
+
+# (count, sum) of the bot's update_lag_seconds histogram, all modes together
+def scrape_lag(url: str) -> tuple:
+    count = total = 0.0
+    with urllib.request.urlopen(url, timeout=5) as r:
+        for line in r.read().decode().splitlines():
+            if line.startswith("update_lag_seconds_count"):
+                count += float(line.rsplit(" ", 1)[1])
+            elif line.startswith("update_lag_seconds_sum"):
+                total += float(line.rsplit(" ", 1)[1])
+    return count, total
+
+# waits for the dispatcher to work through the replayed posts (count stops moving)
+def settle(url: str, before: tuple, expect: int, timeout: float = 15) -> tuple:
+    last, deadline = before, time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        cur = scrape_lag(url)
+        if cur[0] - before[0] >= expect or (cur == last and cur != before):
+            return cur
+        last = cur
+    return last
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", required=True)
+    ap.add_argument("--file", default=os.path.join(HERE, "updates_sample.jsonl"))
+    ap.add_argument("--repeat", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--metrics", default="http://127.0.0.1:9108/metrics",
+                    help="bot metrics endpoint for update-to-handler lag ('' to skip)")
+    args = ap.parse_args()
+
+    updates = load_updates(args.file) * args.repeat
+    before = scrape_lag(args.metrics) if args.metrics else None
+    lat, truncs, errors = [], [], 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for fut in [pool.submit(post, args.url, u) for u in updates]:
+            try:
+                took, trunc = fut.result()
+                lat.append(took)
+                if trunc is not None:
+                    truncs.append(trunc)
+            except Exception as e:
+                errors += 1
+                print(f"error: {e}", file=sys.stderr)
+    wall = time.perf_counter() - t0
+    if lat:
+        print(f"{len(lat)} updates in {wall:.2f}s ({len(lat) / wall:,.0f}/s), {errors} errors")
+        print("request ms: p50 {:.2f}  p95 {:.2f}  p99 {:.2f}  max {:.2f}".format(
+            *(pct(lat, p) * 1000 for p in (50, 95, 99)), max(lat) * 1000))
+    if before is not None and truncs:
+        after = settle(args.metrics, before, len(truncs))
+        n, s = after[0] - before[0], after[1] - before[1]
+        if n:
+            mean = s / n - sum(truncs) / len(truncs)
+            print(f"update->handler ms: mean {max(0.0, mean) * 1000:.1f} over {n:.0f} channel posts")
+        else:
+            print("update->handler: no samples (channel posts not from a payee channel?)")
+    sys.exit(1 if errors else 0)
+
+if __name__ == "__main__":
+    main()
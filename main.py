@@ -6,19 +6,47 @@
 #     * Supports "Received Rs 11", "Received Rs.11", "Money received", fancy digits (𝟙, 1️⃣), commas, decimals
 # - Window = 5m + 10s grace
 # - First-file admin add flow fixed
-
-import os, logging, time, random, re, unicodedata
+# - Run `python main.py migrate` once per deploy (indexes, default config); startup itself only connects lazily
+# - Multi-instance mode (MULTI_INSTANCE = True): several processes share one database and one bot token
+#     * exactly one process (BOT_ROLE=full) takes updates, by long polling or webhook: the add-product
+#       and broadcast conversations, user_data and force-subscribe's pending command live in that
+#       process's memory, so don't put a proxy in front of several webhook servers
+#     * every other process runs with BOT_ROLE=worker: it takes no updates, only drains deliveries
+#       and broadcasts and expires the sessions it finds at startup
+#     * each session is claimed with find_one_and_delete, so exactly one process delivers an order
+#     * notifications are deduped on (channel, message_id) in the notifications collection
+#     * sessions opened by other processes are looked up in Mongo when the local index misses
+#     * deliveries and broadcasts are leased jobs any process can drain: with one token every
+#       process can message every buyer and send the stored file_ids
+
+import os, sys, logging, time, random, threading, heapq, signal, struct, zlib
+from collections import OrderedDict
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from urllib.parse import quote
 
-from telegram import Update, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Bot, Update, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup,
+    InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+)
+from telegram.error import RetryAfter, TimedOut
+from telegram.utils.request import Request
 from telegram.ext import (
     Updater, CommandHandler, MessageHandler, Filters, CallbackContext,
     ConversationHandler, CallbackQueryHandler
 )
 
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import DuplicateKeyError
+from pymongo import MongoClient, ASCENDING, ReturnDocument, UpdateOne, InsertOne
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError, BulkWriteError
+
+import metrics
+from phonepe_parser import parse_payment_amount
+
+try:
+    import qrcode  # optional: pip install qrcode (only the matrix is used; the PNG is encoded here)
+except ImportError:
+    qrcode = None
 
 # ------------ Logging ------------
 logging.basicConfig(format="%(asctime)s %(levelname)s:%(name)s: %(message)s", level=logging.INFO)
@@ -29,153 +57,699 @@ TOKEN = "8352423948:AAEP_WHdxNGziUabzMwO9_YiEp24_d0XYVk"
 ADMIN_IDS = [7223414109, 6053105336, 7381642564]
 
 STORAGE_CHANNEL_ID = -1002724249292         # where admin-uploaded files are stored
-PAYMENT_NOTIF_CHANNEL_ID = -1002865174188   # channel that receives PhonePe Business messages
+PAYMENT_NOTIF_CHANNEL_ID = -1002865174188   # channel that receives PhonePe Business messages (main payee)
 
 UPI_ID = "debjyotimondal1010@okhdfcbank"
 UPI_PAYEE_NAME = "Seller"
+# Payees: amounts only need to be unique per payee, so each extra merchant account (UPI ID +
+# its own PhonePe Business notification channel) adds a whole amount pool. The first entry
+# keeps the id "main" so locks/sessions written before payees existed still resolve.
+UPI_PAYEES = [
+    {"id": "main", "upi_id": UPI_ID, "name": UPI_PAYEE_NAME, "notif_channel_id": PAYMENT_NOTIF_CHANNEL_ID},
+]
+DEFAULT_PAYEE = UPI_PAYEES[0]["id"]
+PAYEES = {p["id"]: p for p in UPI_PAYEES}
+PAYEE_BY_CHANNEL = {p["notif_channel_id"]: p["id"] for p in UPI_PAYEES}
+
+UPI_NOTE_TEMPLATE = "order_{item_id}"  # per item (not per buyer) so rendered QRs can be reused
+QR_CACHE_SIZE = 1024                   # (payee, amount_key, note) -> Telegram file_id of the uploaded QR
+
+MULTI_INSTANCE = False  # True when more than one bot process shares this database
+BOT_ROLE = os.getenv("BOT_ROLE", "full")  # "full" = take updates + run workers, "worker" = workers only (MULTI_INSTANCE)
 
 PAY_WINDOW_MINUTES = 5
 GRACE_SECONDS = 10  # total window = 5m + 10s
+EXPIRY_NOTICE_ENABLED = True  # tell the buyer when their QR expires unpaid
+RECONCILE_STARTUP_MINUTES = 30  # unmatched payments replayed at boot
+EXPIRED_KEEP_HOURS = 24         # lapsed sessions stay matchable (late, replayed, forwarded posts) this long
+RECONCILE_DEFAULT_MINUTES = 60  # /reconcile without an argument
+PAYMENT_RETRY_SECONDS = 10      # a notification whose processing raised is retried after attempt * this
+PAYMENT_MAX_ATTEMPTS = 5
+STARTUP_CATCHUP_SECONDS = 30    # sessions that lapsed while down stay matchable this long after boot
 
 PROTECT_CONTENT_ENABLED = False
 FORCE_SUBSCRIBE_ENABLED = True
 FORCE_SUBSCRIBE_CHANNEL_IDS = []  # add channel IDs if you want FS
+FS_MEMBER_TTL = 600               # confirmed membership is trusted this long
+FS_NONMEMBER_TTL = 20             # "not joined" is rechecked sooner (and always on "I have joined")
+
+DISPATCHER_WORKERS = 4  # PTB update-handler threads
+
+# Bot API pacing (Telegram allows ~30 msg/s overall, ~1 msg/s per chat with short bursts)
+API_RATE_PER_SEC = 25
+PER_CHAT_INTERVAL = 0.35
+MAX_SEND_ATTEMPTS = 5
+
+DELIVERY_WORKERS = 4
+DELIVERY_LEASE_SECONDS = 300     # a running delivery untouched this long is picked up again
+DELIVERY_POLL_SECONDS = 5        # idle workers also poll Mongo (retries, other instances)
+DELIVERY_MAX_ATTEMPTS = 5
+DELIVERY_BACKOFF_SECONDS = 30    # wait before retrying a failed attempt, doubled each time
+
+WRITE_BEHIND_MAX_OPS = 500      # flush when this many writes are buffered...
+WRITE_BEHIND_SECONDS = 2         # ...or this often, and at shutdown
+SEEN_USERS_MAX = 200000          # users whose stored username is known (skips repeat upserts)
+
+PRODUCT_CACHE_SIZE = 2000
+PRODUCT_CACHE_TTL = 600          # products are never edited by the bot; this alone bounds staleness of manual DB edits
+PRODUCT_MISS_TTL = 60            # unknown item_ids (link scanners) are remembered this long
+
+BROADCAST_WORKERS = 8
+BROADCAST_BATCH = 200            # users per checkpoint
+BROADCAST_PROGRESS_SECONDS = 15  # admin progress edit interval
+BROADCAST_LEASE_SECONDS = 120    # a running job without heartbeat this long is resumed
+BROADCAST_HEARTBEAT_SECONDS = 30 # heartbeat interval while a job runs, mid-batch included
+
+# One Bot (and one urllib3 pool) is shared by every thread that calls the API; sized for all of
+# them at once, or urllib3 opens and discards extra connections under load. +2: updater + job queue.
+BOT_API_POOL_SIZE = DISPATCHER_WORKERS + DELIVERY_WORKERS + BROADCAST_WORKERS + 2
+
+# ------------ Updates: long polling, or webhook behind a local reverse proxy ------------
+# Webhook mode is on when WEBHOOK_URL is set (public https base the proxy serves, e.g.
+# https://bot.example.com). PTB's built-in server listens on WEBHOOK_LISTEN:WEBHOOK_PORT and the
+# proxy forwards /<WEBHOOK_PATH>/<WEBHOOK_SECRET> to it; the secret path segment is what keeps
+# forged updates out (PTB 13's server doesn't check Telegram's secret-token header).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "tg")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# ------------ Metrics (local Prometheus endpoint) ------------
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 = off
+SLOW_OP_MS = 500                                       # log any timed op slower than this (None = off)
 
 # ------------ Mongo (Atlas URI) ------------
 MONGO_URI = os.getenv(
     "MONGO_URI",
     "mongodb+srv://Me:Me@cluster0.3lpdrgm.mongodb.net/?retryWrites=true&w=majority&appName=Cluster0"
 )
-mdb = MongoClient(MONGO_URI)["upi_bot"]
-
-c_users    = mdb["users"]     # {user_id, username}
-c_products = mdb["products"]  # {item_id, min_price, max_price, files:[{channel_id, message_id}]}
-c_config   = mdb["config"]    # {key, value}
-c_sessions = mdb["sessions"]  # {key, user_id, chat_id, item_id, amount, amount_key, created_at, hard_expire_at}
-c_locks    = mdb["locks"]     # {amount_key, hard_expire_at, created_at}
-c_paylog   = mdb["payments"]  # optional logs {key, ts, raw}
-
-# Indexes (idempotent)
-c_users.create_index([("user_id", ASCENDING)], unique=True)
-c_products.create_index([("item_id", ASCENDING)], unique=True)
-c_config.create_index([("key", ASCENDING)], unique=True)
-
-c_locks.create_index([("amount_key", ASCENDING)], unique=True)
-c_locks.create_index([("hard_expire_at", ASCENDING)], expireAfterSeconds=0)
-
-c_sessions.create_index([("key", ASCENDING)], unique=True)
-c_sessions.create_index([("amount_key", ASCENDING)])
-c_sessions.create_index([("hard_expire_at", ASCENDING)], expireAfterSeconds=0)
-
-c_paylog.create_index([("ts", ASCENDING)])
+MONGO_DB = "upi_bot"
+
+# Collections are lazy: nothing connects until the first real operation, so importing this
+# module (tests, benchmarks, `migrate`) costs no network round trips.
+_mdb = None
+_mdb_lock = threading.Lock()
+_collections = []
+
+def get_db():
+    global _mdb
+    if _mdb is None:
+        with _mdb_lock:
+            if _mdb is None:
+                _mdb = MongoClient(MONGO_URI, event_listeners=[metrics.MongoCommandMetrics()])[MONGO_DB]
+    return _mdb
+
+# Swap the backing database (benchmarks / fakes); collections re-resolve on next use
+def set_db(db):
+    global _mdb
+    with _mdb_lock:
+        _mdb = db
+        for c in _collections:
+            c._coll = None
+
+class LazyCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._coll = None
+        _collections.append(self)
+
+    def __getattr__(self, attr):
+        coll = self._coll
+        if coll is None:
+            coll = self._coll = get_db()[self.name]
+        return getattr(coll, attr)
+
+c_users    = LazyCollection("users")     # {user_id, username}
+c_products = LazyCollection("products")  # {item_id, min_price, max_price, files:[{channel_id, message_id, type?, file_id?, caption?}]}
+c_config   = LazyCollection("config")    # {key, value}
+c_sessions = LazyCollection("sessions")  # {key, user_id, chat_id, item_id, payee, amount, amount_key, created_at, hard_expire_at}
+c_locks    = LazyCollection("locks")     # {payee, amount_key, amount, hard_expire_at, created_at}
+c_paylog   = LazyCollection("payments")  # optional logs {payee, key, ts, raw, matched}
+c_delivs   = LazyCollection("deliveries") # {user_id, chat_id, item_id, status, files:[{...product file, state}], notified, attempts, lease_until, paid_at, created_at}
+c_notifs   = LazyCollection("notifications") # seen PhonePe posts (multi-instance dedup) {chat_id, message_id, created_at}
+c_expired  = LazyCollection("expired_sessions") # lapsed sessions kept for late matching {...session fields, expired_at}
+c_stats    = LazyCollection("stats")     # rollups {_id: "totals" | "day:YYYY-MM-DD", sales, revenue, items:{item_id:{sales, revenue}}, p2d_sum, p2d_count}
+c_bcjobs   = LazyCollection("broadcasts") # {files, text, cursor, ok, fail, status, admin_chat_id, progress_msg_id, heartbeat, created_at}
+
+# create_index can't change expireAfterSeconds on an existing TTL index; collMod can
+def _ttl_index(coll, field: str, seconds: int):
+    try:
+        coll.create_index([(field, ASCENDING)], expireAfterSeconds=seconds)
+    except OperationFailure:
+        coll.database.command("collMod", coll.name,
+                              index={"keyPattern": {field: 1}, "expireAfterSeconds": seconds})
+
+# One-off schema setup, run once per deploy: `python main.py migrate` (idempotent)
+def migrate():
+    c_users.create_index([("user_id", ASCENDING)], unique=True)
+    c_products.create_index([("item_id", ASCENDING)], unique=True)
+    c_config.create_index([("key", ASCENDING)], unique=True)
+
+    # locks/sessions written before payees existed belong to the main payee; old locks also lack
+    # the numeric amount taken_amount_keys filters on. Backfill before the per-payee index goes in,
+    # or a live legacy lock would read as free and its amount be handed out twice.
+    c_sessions.update_many({"payee": {"$exists": False}}, {"$set": {"payee": DEFAULT_PAYEE}})
+    legacy = [UpdateOne({"_id": d["_id"]}, {"$set": {"payee": d.get("payee", DEFAULT_PAYEE),
+                                                     "amount": float(d["amount_key"])}})
+              for d in c_locks.find({"$or": [{"payee": {"$exists": False}}, {"amount": {"$exists": False}}]})]
+    if legacy:
+        c_locks.bulk_write(legacy, ordered=False)
+        log.info(f"Backfilled {len(legacy)} pre-payee locks")
+    if "amount_key_1" in c_locks.index_information():
+        c_locks.drop_index("amount_key_1")  # pre-payee global uniqueness
+    c_locks.create_index([("payee", ASCENDING), ("amount_key", ASCENDING)], unique=True)
+    c_locks.create_index([("amount", ASCENDING)])
+    c_locks.create_index([("hard_expire_at", ASCENDING)], expireAfterSeconds=0)
+
+    c_sessions.create_index([("key", ASCENDING)], unique=True)
+    c_sessions.create_index([("payee", ASCENDING), ("amount_key", ASCENDING)])
+    # expiry moves sessions to c_expired; this TTL only catches ones orphaned by a crash,
+    # kept long enough for startup to archive them
+    _ttl_index(c_sessions, "hard_expire_at", EXPIRED_KEEP_HOURS * 3600)
+
+    c_expired.create_index([("payee", ASCENDING), ("amount_key", ASCENDING)])
+    _ttl_index(c_expired, "hard_expire_at", EXPIRED_KEEP_HOURS * 3600)
+
+    c_paylog.create_index([("ts", ASCENDING)])
+
+    c_notifs.create_index([("chat_id", ASCENDING), ("message_id", ASCENDING)], unique=True)
+    c_notifs.create_index([("created_at", ASCENDING)], expireAfterSeconds=2*24*3600)
+
+    c_delivs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    c_bcjobs.create_index([("status", ASCENDING), ("heartbeat", ASCENDING)])
+
+    seed_defaults()
+    log.info("Migration done")
+
+DEFAULT_CONFIG = {
+    "welcome_text": "Welcome!",
+    "force_sub_text": "Join required channels to continue.",
+}
+
+# Missing defaults in one bulk upsert; existing values are left alone
+def seed_defaults():
+    c_config.bulk_write([UpdateOne({"key": k}, {"$setOnInsert": {"value": v}}, upsert=True)
+                         for k, v in DEFAULT_CONFIG.items()], ordered=False)
+
+# ------------ Caches ------------
+_ABSENT = object()
+
+class LRUCache:
+    # bounded, thread-safe; each entry may carry its own TTL
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            hit = self._data.get(key, _ABSENT)
+            if hit is _ABSENT:
+                return default
+            value, expires = hit
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (value, None if ttl is None else time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+# ------------ Write-behind buffer ------------
+# Non-critical writes (user upserts, payment log) leave the request path: they are
+# buffered per collection and sent as one unordered bulk_write on size/time/shutdown.
+# on_drop (optional) runs for each op that never made it to Mongo.
+class WriteBehind:
+    def __init__(self, max_ops: int, interval: float):
+        self.max_ops = max_ops
+        self.interval = interval
+        self._pending = {}  # collection name -> (collection, [ops], [on_drop])
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time, so batches land in order
+        self._stop = threading.Event()
+
+    def add(self, coll, op, on_drop=None):
+        with self._lock:
+            _, ops, drops = self._pending.setdefault(coll.name, (coll, [], []))
+            ops.append(op)
+            drops.append(on_drop)
+            self._count += 1
+            full = self._count >= self.max_ops
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._count = self._pending, {}, 0
+            self._write(pending)
+
+    def _write(self, pending: dict):
+        for coll, ops, drops in pending.values():
+            try:
+                coll.bulk_write(ops, ordered=False)
+                continue
+            except BulkWriteError as e:
+                failed = [err["index"] for err in e.details.get("writeErrors", [])]
+                log.warning(f"Write-behind {coll.name}: {len(failed)} of {len(ops)} ops failed")
+            except PyMongoError as e:
+                failed = range(len(ops))
+                log.error(f"Write-behind {coll.name}: dropped {len(ops)} ops: {e}")
+            for i in failed:
+                if drops[i] is not None:
+                    drops[i]()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+write_behind = WriteBehind(WRITE_BEHIND_MAX_OPS, WRITE_BEHIND_SECONDS)
+
+# ------------ Config cache ------------
+# Whole c_config held in memory; set_cfg writes through and bumps a version doc.
+# Writes from other instances arrive via a change stream, or by polling the
+# version doc when change streams aren't available (standalone mongod).
+CONFIG_VERSION_KEY = "__version__"
+CONFIG_POLL_SECONDS = 30
+
+class ConfigCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+
+    def load(self):
+        values = {d["key"]: d["value"] for d in c_config.find({}, {"_id": 0}) if "value" in d}
+        with self._lock:
+            self._values = values
+
+    def get(self, key: str, default=None):
+        if self._values is None:
+            self.load()
+        return self._values.get(key, default)
+
+    def set(self, key: str, value):
+        if self._values is None:
+            self.load()
+        c_config.update_one({"key": key}, {"$set": {"value": value}}, upsert=True)
+        ver = c_config.find_one_and_update({"key": CONFIG_VERSION_KEY}, {"$inc": {"value": 1}},
+                                           upsert=True, return_document=ReturnDocument.AFTER)
+        with self._lock:
+            self._values[key] = value
+            self._values[CONFIG_VERSION_KEY] = ver["value"]
+
+    def _poll(self):
+        while True:
+            time.sleep(CONFIG_POLL_SECONDS)
+            try:
+                doc = c_config.find_one({"key": CONFIG_VERSION_KEY})
+                if doc and doc.get("value") != self.get(CONFIG_VERSION_KEY):
+                    self.load()
+            except PyMongoError as e:
+                log.warning(f"Config poll failed: {e}")
+
+    def _watch(self):
+        while True:
+            try:
+                with c_config.watch() as stream:
+                    self.load()  # catch anything written before the stream opened
+                    for _ in stream:
+                        self.load()  # config is a handful of docs; reloading beats patching
+            except OperationFailure as e:
+                log.info(f"Config change stream unavailable ({e}); polling every {CONFIG_POLL_SECONDS}s")
+                return self._poll()
+            except PyMongoError as e:
+                log.warning(f"Config change stream dropped: {e}")
+                time.sleep(5)
+
+    def start_sync(self):
+        threading.Thread(target=self._watch, name="config-sync", daemon=True).start()
+
+config_cache = ConfigCache()
 
 # ------------ Helpers ------------
 def cfg(key: str, default=None):
-    doc = c_config.find_one({"key": key})
-    return doc["value"] if doc and "value" in doc else default
+    return config_cache.get(key, default)
 
 def set_cfg(key: str, value):
-    c_config.update_one({"key": key}, {"$set": {"value": value}}, upsert=True)
+    config_cache.set(key, value)
 
 def amount_key(x: float) -> str:
     return f"{x:.2f}" if abs(x - int(x)) > 1e-9 else str(int(x))
 
-def build_upi_uri(amount: float, note: str):
+def build_upi_uri(amount: float, note: str, payee: str = DEFAULT_PAYEE):
     amt = f"{int(amount)}" if abs(amount-int(amount))<1e-9 else f"{amount:.2f}"
-    pa = quote(UPI_ID, safe='')
-    pn = quote(UPI_PAYEE_NAME, safe='')
+    pa = quote(PAYEES[payee]["upi_id"], safe='')
+    pn = quote(PAYEES[payee]["name"], safe='')
     tn = quote(note, safe='')
     return f"upi://pay?pa={pa}&pn={pn}&am={amt}&cu=INR&tn={tn}"
 
 def qr_url(data: str):
     return f"https://api.qrserver.com/v1/create-qr-code/?data={quote(data, safe='')}&size=512x512&qzone=2"
 
-def add_user(uid: int, uname: str):
-    c_users.update_one({"user_id": uid}, {"$set": {"username": uname or ""}}, upsert=True)
+QR_BOX = 12  # pixels per module
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+# 1-bit grayscale PNG built with bytes ops + zlib (C); qrcode's pure-Python PyPNG writer took
+# ~25ms of GIL-held CPU per image inside the checkout handler
+def render_qr_png(data: str) -> bytes:
+    qr = qrcode.QRCode(border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()  # border included; True = dark
+    size = len(matrix) * QR_BOX
+    nbytes = (size + 7) // 8
+    rows = []
+    for mrow in matrix:
+        bits = "".join(("0" if dark else "1") * QR_BOX for dark in mrow)
+        line = b"\x00" + int(bits.ljust(nbytes * 8, "1"), 2).to_bytes(nbytes, "big")  # filter 0 + pixels
+        rows.append(line * QR_BOX)
+    return (b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+            + _png_chunk(b"IEND", b""))
+
+# QR photo for this amount: cached file_id, else rendered locally (remote URL only without qrcode)
+qr_cache = LRUCache(QR_CACHE_SIZE)
+
+def send_qr(bot, chat_id: int, payee: str, amount: float, note: str, **kw):
+    key = (payee, amount_key(amount), note)
+    photo = qr_cache.get(key)
+    if photo is None:
+        uri = build_upi_uri(amount, note, payee)
+        photo = qr_url(uri)
+        if qrcode is not None:
+            try:
+                photo = render_qr_png(uri)
+            except Exception as e:
+                log.warning(f"QR render failed, using remote QR: {e}")
+    m = bot.send_photo(chat_id=chat_id, photo=photo, **kw)
+    if m and m.photo:
+        qr_cache.put(key, m.photo[-1].file_id)
+    return m
 
-def get_all_user_ids():
-    return list(c_users.distinct("user_id"))
+seen_users = LRUCache(SEEN_USERS_MAX)  # user_id -> username last written
 
-# Amount reservation (global uniqueness via Mongo)
-def reserve_amount_key(k: str, hard_expire_at: datetime) -> bool:
+def add_user(uid: int, uname: str):
+    uname = uname or ""
+    if seen_users.get(uid, _ABSENT) == uname:
+        return
+    seen_users.put(uid, uname)
+    # a dropped upsert must not leave the user marked as stored, or later /starts skip it
+    write_behind.add(c_users, UpdateOne({"user_id": uid}, {"$set": {"username": uname}}, upsert=True),
+                     on_drop=lambda: seen_users.pop(uid))
+
+# Streams user_ids in ascending order, one projected page of `batch` at a time (keyset
+# paging, so no long-lived cursor). Resume with after=<last id>; slice with [lo, hi).
+def iter_user_ids(after=None, lo=None, hi=None, batch: int = 1000):
+    rng = {}
+    if lo is not None:
+        rng["$gte"] = lo
+    if hi is not None:
+        rng["$lt"] = hi
+    while True:
+        if after is not None:
+            rng["$gt"] = after
+        page = [d["user_id"] for d in c_users.find({"user_id": rng} if rng else {}, {"user_id": 1, "_id": 0})
+                                             .sort("user_id", ASCENDING).limit(batch)]
+        yield from page
+        if len(page) < batch:
+            return
+        after = page[-1]
+
+# Product lookups go through an LRU; misses are cached too (as None) with a short TTL.
+# Nothing edits a product in place, so there is no invalidation: PRODUCT_CACHE_TTL is the bound.
+product_cache = LRUCache(PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+
+def get_product(item_id: str):
+    prod = product_cache.get(item_id, _ABSENT)
+    if prod is _ABSENT:
+        prod = c_products.find_one({"item_id": item_id})
+        product_cache.put(item_id, prod, ttl=None if prod else PRODUCT_MISS_TTL)
+    return prod
+
+# Amount reservation (unique per payee via Mongo)
+def reserve_amount_key(payee: str, k: str, amount: float, hard_expire_at: datetime) -> bool:
+    # single atomic claim: inserts a fresh lock, or takes over one whose window already
+    # passed but the TTL monitor hasn't swept yet; a live lock -> DuplicateKeyError
+    now = datetime.utcnow()
     try:
-        c_locks.insert_one({
-            "amount_key": k,
-            "hard_expire_at": hard_expire_at,
-            "created_at": datetime.utcnow()
-        })
+        c_locks.update_one(
+            {"payee": payee, "amount_key": k, "hard_expire_at": {"$lt": now}},
+            {"$set": {"amount": amount, "hard_expire_at": hard_expire_at, "created_at": now}},
+            upsert=True
+        )
         return True
     except DuplicateKeyError:
         return False
 
-def release_amount_key(k: str):
-    c_locks.delete_one({"amount_key": k})
+# hard_expire_at pins the release to the reservation that owned the key: once a window
+# has passed, reserve_amount_key may already have handed the key to a new order
+def release_amount_key(payee: str, k: str, hard_expire_at: datetime = None):
+    q = {"payee": payee, "amount_key": k}
+    if hard_expire_at is not None:
+        q["hard_expire_at"] = hard_expire_at
+    c_locks.delete_one(q)
+
+def taken_amount_keys(lo: float, hi: float) -> dict:
+    # one indexed range read (all payees) instead of one failed insert per busy candidate
+    cur = c_locks.find(
+        {"amount": {"$gte": lo, "$lt": hi + 1}, "hard_expire_at": {"$gte": datetime.utcnow()}},
+        {"payee": 1, "amount_key": 1, "_id": 0}
+    )
+    taken = {p: set() for p in PAYEES}
+    for d in cur:
+        taken.setdefault(d.get("payee", DEFAULT_PAYEE), set()).add(d["amount_key"])
+    return taken
 
-def pick_unique_amount(lo: float, hi: float, hard_expire_at: datetime) -> float:
-    lo, hi = int(lo), int(hi)
-    ints = list(range(lo, hi+1))
-    random.shuffle(ints)
-    # try integers first
+def _amount_candidates(ints):
+    # integers first, then decimals (base.01 .. base.99) only if needed
     for v in ints:
-        k = str(v)
-        if reserve_amount_key(k, hard_expire_at):
-            return float(v)
-    # fall back to decimals if all ints are busy
+        yield str(v), float(v)
     for base in ints:
         for p in range(1, 100):
             k = f"{base}.{p:02d}"
-            if reserve_amount_key(k, hard_expire_at):
-                return float(f"{base}.{p:02d}")
-    return float(ints[-1])
-
-# ---- PhonePe amount parsing (handles fancy digits like 𝟙 and keycaps 1️⃣) ----
-def _normalize_digits(s: str) -> str:
-    out = []
-    for ch in s:
-        # drop combining marks (keycap enclosure, variation selectors)
-        if unicodedata.category(ch).startswith('M'):
-            continue
-        # map any unicode decimal digit to ASCII 0-9
-        if ch.isdigit():
-            try:
-                out.append(str(unicodedata.digit(ch)))
+            yield k, float(k)
+
+# Returns (payee, amount), or None when every key in [lo, hi] is in use on every payee.
+# Candidates drive the outer loop so a free integer on any payee beats a decimal on all of
+# them; within one candidate the least-loaded payee is tried first.
+def pick_unique_amount(lo: float, hi: float, hard_expire_at: datetime):
+    lo, hi = int(lo), int(hi)
+    ints = list(range(lo, hi+1))
+    random.shuffle(ints)
+    taken = taken_amount_keys(lo, hi)
+    payees = sorted(PAYEES, key=lambda p: (len(taken[p]), random.random()))
+    for k, v in _amount_candidates(ints):
+        for payee in payees:
+            if k in taken[payee]:
                 continue
+            if reserve_amount_key(payee, k, v, hard_expire_at):
+                metrics.inc("allocator_picks_total", kind="integer" if "." not in k else "decimal")
+                return payee, v
+            # lost a race for this key; carry on with the next free one
+            metrics.inc("allocator_races_total")
+    metrics.inc("allocator_picks_total", kind="exhausted")
+    return None
+
+# ------------ Open-session index ------------
+# In-memory mirror of c_sessions so payment matching is a dict lookup:
+# (payee, amount_key) -> {session key: doc}, plus a heap on hard_expire_at for pruning.
+# Mongo stays the durable copy (written through on add, reloaded at startup).
+SESSION_PRUNE_SLACK = timedelta(seconds=60)  # keep late-processed notifications matchable
+
+class SessionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_amount = {}  # (payee, amount_key) -> {session key: doc}
+        self._heap = []
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(b) for b in self._by_amount.values())
+
+    @staticmethod
+    def _slot(doc):
+        return doc.get("payee", DEFAULT_PAYEE), doc["amount_key"]
+
+    def _put(self, doc):
+        slot = self._slot(doc)
+        self._by_amount.setdefault(slot, {})[doc["key"]] = doc
+        heapq.heappush(self._heap, (doc["hard_expire_at"], doc["key"], slot))
+
+    def _drop(self, slot, key):
+        bucket = self._by_amount.get(slot)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._by_amount[slot]
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - SESSION_PRUNE_SLACK
+        while self._heap and self._heap[0][0] < cutoff:
+            _, key, slot = heapq.heappop(self._heap)
+            self._drop(slot, key)
+
+    def load(self) -> int:
+        docs = list(c_sessions.find({"hard_expire_at": {"$gte": datetime.utcnow() - SESSION_PRUNE_SLACK}}))
+        with self._lock:
+            self._by_amount, self._heap = {}, []
+            for d in docs:
+                self._put(d)
+        return len(docs)
+
+    def all(self) -> list:
+        with self._lock:
+            return [d for b in self._by_amount.values() for d in b.values()]
+
+    def discard(self, doc: dict):
+        with self._lock:
+            self._drop(self._slot(doc), doc["key"])
+
+    def add(self, doc: dict):
+        c_sessions.insert_one(doc)
+        with self._lock:
+            self._prune()
+            self._put(doc)
+
+    # Removes and returns the payee's sessions on this amount whose window covers ts
+    def take(self, payee: str, akey: str, ts: datetime) -> list:
+        slot = (payee, akey)
+        with self._lock:
+            self._prune()
+            bucket = self._by_amount.get(slot) or {}
+            hits = [d for d in bucket.values() if d["created_at"] <= ts <= d["hard_expire_at"]]
+            for d in hits:
+                self._drop(slot, d["key"])
+        return hits
+
+open_sessions = SessionIndex()
+
+# ------------ Rate limiting (Bot API) ------------
+class RateLimiter:
+    # token bucket shared by every sender thread; pause() stalls all of them on a flood wait
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                    self._stamp = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+class ChatRateLimiter:
+    # minimum spacing between messages to the same chat
+    def __init__(self, interval: float, max_chats: int = 50000):
+        self.interval = interval
+        self.max_chats = max_chats
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, chat_id: int):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._next) >= self.max_chats:
+                self._next = {c: t for c, t in self._next.items() if t > now}
+            at = max(now, self._next.get(chat_id, 0.0))
+            self._next[chat_id] = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+api_limiter = RateLimiter(API_RATE_PER_SEC)
+chat_limiter = ChatRateLimiter(PER_CHAT_INTERVAL)
+
+# Paced Bot API call; flood waits (RetryAfter) and timeouts are retried, anything else raises
+def send_paced(target: int, call, *a, **k):
+    for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+        chat_limiter.wait(target)
+        api_limiter.wait()
+        try:
+            return call(*a, **k)
+        except RetryAfter as e:
+            log.warning(f"Flood wait {e.retry_after}s (chat {target})")
+            api_limiter.pause(e.retry_after + 1)
+            if attempt == MAX_SEND_ATTEMPTS:
+                raise
+        except TimedOut:
+            if attempt == MAX_SEND_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+
+# ------------ Force Subscribe ------------
+fs_member_cache = LRUCache(100000)  # (channel, user) -> joined?
+fs_chat_cache = LRUCache(256)       # channel -> (title, invite link)
+
+def missing_channels(bot, uid: int, recheck: bool = False) -> list:
+    need = []
+    for ch in FORCE_SUBSCRIBE_CHANNEL_IDS:
+        joined = fs_member_cache.get((ch, uid))
+        if joined is None or (recheck and not joined):
+            try:
+                mem = bot.get_chat_member(ch, uid)
+                joined = mem.status in ("member", "administrator", "creator")
+                fs_member_cache.put((ch, uid), joined, ttl=FS_MEMBER_TTL if joined else FS_NONMEMBER_TTL)
             except Exception:
-                pass
-        out.append(ch)
-    return "".join(out)
-
-# Allow "received rs" or "you've received rs" and tolerate punctuation after "rs"
-PHONEPE_RE = re.compile(
-    r"(?:received\s*rs|you['’]ve\s*received\s*rs)\s*[.:₹\s]*([0-9][0-9,]*(?:\.[0-9]{1,2})?)",
-    re.I | re.S
-)
+                joined = False
+        if not joined:
+            need.append(ch)
+    return need
 
-def parse_phonepe_amount(text: str):
-    norm = _normalize_digits(text or "")
-    m = PHONEPE_RE.search(norm)
-    if not m:
-        return None
-    token = m.group(1).replace(",", "")
-    try:
-        return float(token)
-    except Exception:
-        return None
+def join_button(bot, ch):
+    info = fs_chat_cache.get(ch)
+    if info is None:
+        chat = bot.get_chat(ch)
+        info = (chat.title, chat.invite_link or bot.export_chat_invite_link(ch))
+        fs_chat_cache.put(ch, info)
+    return InlineKeyboardButton(f"Join {info[0]}", url=info[1])
 
-# ------------ Force Subscribe ------------
 def force_subscribe(fn):
     def wrapper(update: Update, context: CallbackContext, *a, **k):
         if (not FORCE_SUBSCRIBE_ENABLED) or (not FORCE_SUBSCRIBE_CHANNEL_IDS) or (update.effective_user.id in ADMIN_IDS):
             return fn(update, context, *a, **k)
-        uid = update.effective_user.id
-        need = []
-        for ch in FORCE_SUBSCRIBE_CHANNEL_IDS:
-            try:
-                mem = context.bot.get_chat_member(ch, uid)
-                if mem.status not in ("member", "administrator", "creator"):
-                    need.append(ch)
-            except Exception:
-                need.append(ch)
+        need = missing_channels(context.bot, update.effective_user.id)
         if not need:
             return fn(update, context, *a, **k)
 
@@ -183,9 +757,7 @@ def force_subscribe(fn):
         btns = []
         for ch in need:
             try:
-                chat = context.bot.get_chat(ch)
-                link = chat.invite_link or context.bot.export_chat_invite_link(ch)
-                btns.append([InlineKeyboardButton(f"Join {chat.title}", url=link)])
+                btns.append([join_button(context.bot, ch)])
             except Exception as e:
                 log.warning(f"Invite link fail {ch}: {e}")
         btns.append([InlineKeyboardButton("✅ I have joined", callback_data="check_join")])
@@ -200,15 +772,7 @@ def force_subscribe(fn):
 
 def check_join_cb(update: Update, context: CallbackContext):
     q = update.callback_query
-    uid = q.from_user.id
-    need = []
-    for ch in FORCE_SUBSCRIBE_CHANNEL_IDS:
-        try:
-            mem = context.bot.get_chat_member(ch, uid)
-            if mem.status not in ("member","administrator","creator"):
-                need.append(ch)
-        except Exception:
-            need.append(ch)
+    need = missing_channels(context.bot, q.from_user.id, recheck=True)
     if not need:
         try: q.message.delete()
         except: pass
@@ -218,9 +782,31 @@ def check_join_cb(update: Update, context: CallbackContext):
     else:
         q.answer("Still not joined all.", show_alert=True)
 
+# ------------ Sales rollups ------------
+# Counters kept up to date as payments match (via write-behind $inc), so /stats reads a
+# handful of small docs instead of scanning collections. Days are UTC.
+def _day_id(ts: datetime) -> str:
+    return f"day:{ts:%Y-%m-%d}"
+
+# $inc isn't safe to replay (a half-applied batch would double count), so a dropped one is
+# logged with its values instead, enough to correct the rollup by hand
+def _stats_inc(doc_id: str, inc: dict):
+    write_behind.add(c_stats, UpdateOne({"_id": doc_id}, {"$inc": inc}, upsert=True),
+                     on_drop=lambda: log.error(f"Stats rollup lost: {doc_id} $inc {inc}"))
+
+def record_sale(sess: dict, paid_at: datetime):
+    amt = float(sess.get("amount", 0))
+    item = sess["item_id"]
+    _stats_inc("totals", {"sales": 1, "revenue": amt})
+    _stats_inc(_day_id(paid_at), {"sales": 1, "revenue": amt, f"items.{item}.sales": 1, f"items.{item}.revenue": amt})
+
+def record_delivery_latency(paid_at: datetime, seconds: float):
+    _stats_inc(_day_id(paid_at), {"p2d_sum": seconds, "p2d_count": 1})
+
 # ------------ Purchase / Delivery ------------
+@metrics.timed("handler_seconds", handler="start_purchase")
 def start_purchase(ctx: CallbackContext, chat_id: int, uid: int, item_id: str):
-    prod = c_products.find_one({"item_id": item_id})
+    prod = get_product(item_id)
     if not prod:
         return ctx.bot.send_message(chat_id, "❌ Item not found.")
 
@@ -233,18 +819,18 @@ def start_purchase(ctx: CallbackContext, chat_id: int, uid: int, item_id: str):
         mn = mx = v
 
     created = datetime.utcnow()
+    created = created.replace(microsecond=created.microsecond // 1000 * 1000)  # Mongo keeps ms; must round-trip equal
     hard_expire_at = created + timedelta(minutes=PAY_WINDOW_MINUTES, seconds=GRACE_SECONDS)
 
-    amt = pick_unique_amount(mn, mx, hard_expire_at)
+    picked = pick_unique_amount(mn, mx, hard_expire_at)
+    if picked is None:
+        return ctx.bot.send_message(chat_id, "⏳ All payment slots are busy right now. Please try again in a few minutes.")
+    payee, amt = picked
     akey = amount_key(amt)
 
-    # QR is generated from UPI URI, but we do not show the link
-    uri = build_upi_uri(amt, f"order_uid_{uid}")
-    img = qr_url(uri)
-
     display_amt = int(amt) if abs(amt-int(amt))<1e-9 else f"{amt:.2f}"
     caption = (
-        f"Pay ₹{display_amt} to `{UPI_ID}`.\n\n"
+        f"Pay ₹{display_amt} to `{PAYEES[payee]['upi_id']}`.\n\n"
         "Instructions:\n"
         "• Open any UPI app (GPay / PhonePe / Paytm)\n"
         "• Scan this QR or copy the UPI ID\n"
@@ -252,36 +838,220 @@ def start_purchase(ctx: CallbackContext, chat_id: int, uid: int, item_id: str):
         "Verification is automatic. Files arrive after payment."
     )
 
-    ctx.bot.send_photo(chat_id=chat_id, photo=img, caption=caption, parse_mode=ParseMode.MARKDOWN)
+    # QR is generated from UPI URI, but we do not show the link
+    send_qr(ctx.bot, chat_id, payee, amt, UPI_NOTE_TEMPLATE.format(item_id=item_id),
+            caption=caption, parse_mode=ParseMode.MARKDOWN)
 
     sess_key = f"{uid}:{item_id}:{int(time.time())}"
-    c_sessions.insert_one({
+    sess = {
         "key": sess_key,
         "user_id": uid,
         "chat_id": chat_id,
         "item_id": item_id,
+        "payee": payee,
         "amount": float(amt),
         "amount_key": akey,
         "created_at": created,
         "hard_expire_at": hard_expire_at,
+    }
+    open_sessions.add(sess)
+    schedule_expiry(ctx.job_queue, sess)
+
+# --- Expiry: drop the session once SESSION_PRUNE_SLACK has passed after its window, so a
+# post dated inside the window but handled late still matches (the TTL index is only a backstop).
+# The amount itself is reusable at hard_expire_at already: reserve_amount_key takes over lapsed locks.
+def schedule_expiry(job_queue, sess: dict, not_before: datetime = None):
+    at = sess["hard_expire_at"] + SESSION_PRUNE_SLACK
+    if not_before:
+        at = max(at, not_before)
+    delay = max(0.0, (at - datetime.utcnow()).total_seconds())
+    job_queue.run_once(expire_session, delay, context=sess, name=f"expire:{sess['key']}")
+
+def expire_session(ctx: CallbackContext):
+    sess = ctx.job.context
+    # paid (or expired elsewhere) already -> nothing to do
+    if not archive_session(sess):
+        return
+    release_amount_key(sess.get("payee", DEFAULT_PAYEE), sess["amount_key"], sess["hard_expire_at"])
+    if EXPIRY_NOTICE_ENABLED:
+        try:
+            ctx.bot.send_message(sess["chat_id"], "⌛ Payment window expired. Open the product link again for a new QR.")
+        except Exception as e:
+            log.warning(f"Expiry notice fail: {e}")
+
+# Moves a lapsed session to c_expired, where late/replayed/forwarded posts can still match it
+# (see process_payment, reconcile); False if it was paid or moved meanwhile
+def archive_session(sess: dict) -> bool:
+    doc = c_sessions.find_one_and_delete({"_id": sess["_id"]})
+    if not doc:
+        return False
+    open_sessions.discard(doc)
+    doc["expired_at"] = datetime.utcnow()
+    c_expired.insert_one(doc)
+    return True
+
+# Sessions whose windows lapsed while no process was running (crash, deploy) never had their
+# expiry job run; archive them at startup so they stay matchable
+def archive_lapsed_sessions() -> int:
+    cutoff = datetime.utcnow() - SESSION_PRUNE_SLACK
+    return sum(archive_session(d) for d in c_sessions.find({"hard_expire_at": {"$lt": cutoff}}))
+
+# --- Delivery queue: durable jobs in Mongo, drained by a small worker pool ---
+_deliv_wakeup = threading.Event()
+
+def enqueue_delivery(sess: dict, paid_at: datetime):
+    now = datetime.utcnow()
+    c_delivs.insert_one({
+        "user_id": sess["user_id"], "chat_id": sess["chat_id"], "item_id": sess["item_id"],
+        "status": "queued", "files": None, "notified": False, "attempts": 0,
+        "lease_until": None, "not_before": None, "paid_at": paid_at, "created_at": now, "updated_at": now,
     })
+    _deliv_wakeup.set()
+
+def claim_delivery():
+    now = datetime.utcnow()
+    return c_delivs.find_one_and_update(
+        {"$or": [{"status": "queued", "not_before": None},
+                 {"status": "queued", "not_before": {"$lte": now}},
+                 {"status": "running", "lease_until": {"$lt": now}}]},
+        {"$set": {"status": "running", "lease_until": now + timedelta(seconds=DELIVERY_LEASE_SECONDS),
+                  "updated_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER)
+
+def _deliv_set(job: dict, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    c_delivs.update_one({"_id": job["_id"]}, {"$set": fields})
+
+# Hands the job back to the queue with exponential backoff (sent files stay sent), or fails
+# it for good once DELIVERY_MAX_ATTEMPTS is used up
+def _deliv_retry(bot, job: dict, why: str):
+    if job["attempts"] >= DELIVERY_MAX_ATTEMPTS:
+        return _deliv_fail(bot, job, why)
+    delay = DELIVERY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+    log.warning(f"Delivery {job['_id']} retry in {delay}s: {why}")
+    _deliv_set(job, status="queued", lease_until=None, not_before=datetime.utcnow() + timedelta(seconds=delay))
+
+# A paid order that can't be delivered: tell the buyer and every admin, so it's sent by hand
+def _deliv_fail(bot, job: dict, why: str):
+    log.error(f"Delivery {job['_id']} failed: {why}")
+    _deliv_set(job, status="failed", lease_until=None)
+    try:
+        send_paced(job["chat_id"], bot.send_message, job["chat_id"],
+                   "⚠️ We couldn't deliver your files automatically. An admin has been notified and will send them.")
+    except Exception as e:
+        log.warning(f"Failure notice fail: {e}")
+    for admin in ADMIN_IDS:
+        try:
+            send_paced(admin, bot.send_message, admin,
+                       f"❗ Delivery failed: user {job['user_id']}, item {job['item_id']}, job {job['_id']}\n{why}")
+        except Exception as e:
+            log.warning(f"Admin failure notice fail ({admin}): {e}")
+
+# Album grouping: photos and videos mix, documents and audio only group with their own kind
+ALBUM_MAX = 10
+ALBUM_MEDIA = {"photo": InputMediaPhoto, "video": InputMediaVideo,
+               "document": InputMediaDocument, "audio": InputMediaAudio}
+ALBUM_KIND = {"photo": "visual", "video": "visual", "document": "document", "audio": "audio"}
+
+# Yields lists of pending file indexes: runs of up to ALBUM_MAX compatible files, or single copy-only files
+def album_batches(files: list):
+    batch, batch_kind = [], None
+    for i, f in enumerate(files):
+        if f["state"] != "pending":
+            continue
+        kind = ALBUM_KIND.get(f.get("type"))
+        if batch and (kind is None or kind != batch_kind or len(batch) == ALBUM_MAX):
+            yield batch
+            batch = []
+        batch.append(i)
+        batch_kind = kind
+        if kind is None:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Sends whatever is still pending for this job; per-file state makes retries resume, not repeat
+@metrics.timed("handler_seconds", handler="deliver")
+def deliver(bot, job: dict):
+    uid = job["user_id"]
+    if not job["notified"]:
+        try:
+            send_paced(job["chat_id"], bot.send_message, job["chat_id"], "✅ Payment received. Delivering your files…")
+        except Exception as e:
+            log.warning(f"Notify user fail: {e}")
+        _deliv_set(job, notified=True)
+
+    files = job["files"]
+    if files is None:
+        prod = get_product(job["item_id"])
+        if not prod:
+            return _deliv_fail(bot, job, "item missing")
+        files = [dict(f, state="pending") for f in prod.get("files", [])]
+        _deliv_set(job, files=files)
+
+    for batch in album_batches(files):
+        if len(batch) > 1:
+            try:
+                media = [ALBUM_MEDIA[files[i]["type"]](files[i]["file_id"], caption=files[i].get("caption"))
+                         for i in batch]
+                send_paced(uid, bot.send_media_group, chat_id=uid, media=media,
+                           protect_content=PROTECT_CONTENT_ENABLED)
+                _deliv_set(job, **{f"files.{i}.state": "sent" for i in batch})
+                continue
+            except (RetryAfter, TimedOut):
+                return _deliv_retry(bot, job, f"flood/timeout at file {batch[0]}")
+            except Exception as e:
+                # one stale or foreign file_id sinks the whole album: copy the files one by one
+                log.warning(f"Album fail, copying {len(batch)} files singly: {e}")
+        for i in batch:
+            f = files[i]
+            try:
+                send_paced(uid, bot.copy_message, chat_id=uid, from_chat_id=f["channel_id"], message_id=f["message_id"],
+                           protect_content=PROTECT_CONTENT_ENABLED)
+                state = "sent"
+            except (RetryAfter, TimedOut):
+                return _deliv_retry(bot, job, f"flood/timeout at file {i}")
+            except Exception as e:
+                log.error(f"Deliver fail: {e}")
+                state = "failed"
+            _deliv_set(job, **{f"files.{i}.state": state})
 
-def deliver(ctx: CallbackContext, uid: int, item_id: str):
-    prod = c_products.find_one({"item_id": item_id})
-    if not prod:
-        ctx.bot.send_message(uid, "❌ Item missing.")
-        return
-    files = prod.get("files", [])
-    for f in files:
+    try:
+        send_paced(uid, bot.send_message, uid, "⚠️ Files auto-delete here in 10 minutes. Save now.")
+    except Exception as e:
+        log.warning(f"Delivery notice fail: {e}")
+    _deliv_set(job, status="done", lease_until=None)
+    if job.get("paid_at"):
+        p2d = (datetime.utcnow() - job["paid_at"]).total_seconds()
+        metrics.observe("payment_to_delivery_seconds", p2d)
+        record_delivery_latency(job["paid_at"], p2d)
+
+def _delivery_worker(bot):
+    while True:
+        try:
+            job = claim_delivery()
+        except Exception as e:
+            log.error(f"Delivery claim fail: {e}")
+            job = None
+        if not job:
+            _deliv_wakeup.wait(DELIVERY_POLL_SECONDS)
+            _deliv_wakeup.clear()
+            continue
         try:
-            ctx.bot.copy_message(chat_id=uid, from_chat_id=f["channel_id"], message_id=f["message_id"],
-                                 protect_content=PROTECT_CONTENT_ENABLED)
-            time.sleep(0.35)
+            deliver(bot, job)
         except Exception as e:
-            log.error(f"Deliver fail: {e}")
-    ctx.bot.send_message(uid, "⚠️ Files auto-delete here in 10 minutes. Save now.")
+            log.error(f"Delivery {job['_id']} crashed: {e}")
+            _deliv_retry(bot, job, f"crashed: {e}")
+
+def start_delivery_workers(bot):
+    for n in range(DELIVERY_WORKERS):
+        threading.Thread(target=_delivery_worker, args=(bot,), name=f"deliver-{n}", daemon=True).start()
 
 # ------------ Handlers ------------
+@metrics.timed("handler_seconds", handler="cmd_start")
 @force_subscribe
 def cmd_start(update: Update, context: CallbackContext):
     uid = update.effective_user.id
@@ -308,6 +1078,22 @@ def cancel_conv(update: Update, context: CallbackContext):
 GET_PRODUCT_FILES, PRICE, \
 GET_BROADCAST_FILES, GET_BROADCAST_TEXT, BROADCAST_CONFIRM = range(5)
 
+# Reference to a stored file. type/file_id let deliver() send it inside an album;
+# animations and captions with formatting can't ride in a media group, so those stay copy-only.
+def stored_file_ref(msg) -> dict:
+    ref = {"channel_id": msg.chat_id, "message_id": msg.message_id}
+    if msg.animation or msg.caption_entities:
+        return ref
+    for kind in ("photo", "video", "document", "audio"):
+        media = getattr(msg, kind)
+        if media:
+            ref["type"] = kind
+            ref["file_id"] = (media[-1] if kind == "photo" else media).file_id
+            if msg.caption:
+                ref["caption"] = msg.caption
+            break
+    return ref
+
 def add_product_start(update: Update, context: CallbackContext):
     if update.effective_user.id not in ADMIN_IDS:
         return
@@ -316,7 +1102,7 @@ def add_product_start(update: Update, context: CallbackContext):
     if update.message.effective_attachment:
         try:
             fwd = context.bot.forward_message(STORAGE_CHANNEL_ID, update.message.chat_id, update.message.message_id)
-            context.user_data['new_files'].append({"channel_id": fwd.chat_id, "message_id": fwd.message_id})
+            context.user_data['new_files'].append(stored_file_ref(fwd))
             update.message.reply_text("✅ First file added. Send more or /done.")
         except Exception as e:
             log.error(f"Store fail on first file: {e}")
@@ -332,7 +1118,7 @@ def get_product_files(update: Update, context: CallbackContext):
         return GET_PRODUCT_FILES
     try:
         fwd = context.bot.forward_message(STORAGE_CHANNEL_ID, update.message.chat_id, update.message.message_id)
-        context.user_data['new_files'].append({"channel_id": fwd.chat_id, "message_id": fwd.message_id})
+        context.user_data['new_files'].append(stored_file_ref(fwd))
         update.message.reply_text("✅ Added. Send more or /done.")
         return GET_PRODUCT_FILES
     except Exception as e:
@@ -363,6 +1149,7 @@ def get_price(update: Update, context: CallbackContext):
     if mn == mx:
         doc["price"] = mn
     c_products.insert_one(doc)
+    product_cache.put(item_id, doc)
 
     link = f"https://t.me/{context.bot.username}?start={item_id}"
     update.message.reply_text(f"✅ Product added.\nLink:\n`{link}`", parse_mode=ParseMode.MARKDOWN)
@@ -396,28 +1183,115 @@ def bc_skip(update: Update, context: CallbackContext):
     return bc_confirm(update, context)
 
 def bc_confirm(update: Update, context: CallbackContext):
-    total = c_users.count_documents({})
+    total = c_users.estimated_document_count()
     buttons=[[InlineKeyboardButton("✅ Send", callback_data="send_bc")],
              [InlineKeyboardButton("❌ Cancel", callback_data="cancel_bc")]]
-    update.message.reply_text(f"Broadcast to {total} users. Proceed?", reply_markup=InlineKeyboardMarkup(buttons))
+    update.message.reply_text(f"Broadcast to ~{total} users. Proceed?", reply_markup=InlineKeyboardMarkup(buttons))
     return BROADCAST_CONFIRM
 
+@metrics.timed("handler_seconds", handler="bc_send")
 def bc_send(update: Update, context: CallbackContext):
     q=update.callback_query; q.answer(); q.edit_message_text("Broadcasting…")
-    files=context.user_data.get('b_files',[]); text=context.user_data.get('b_text')
-    ok=fail=0
-    for uid in get_all_user_ids():
-        try:
-            for m in files:
-                context.bot.copy_message(uid, m.chat_id, m.message_id); time.sleep(0.1)
-            if text: context.bot.send_message(uid, text)
-            ok+=1
-        except Exception as e:
-            log.error(e); fail+=1
-    q.message.reply_text(f"Done. Sent:{ok} Fail:{fail}")
+    files=[{"chat_id": m.chat_id, "message_id": m.message_id} for m in context.user_data.get('b_files',[])]
+    job_id = c_bcjobs.insert_one({
+        "files": files, "text": context.user_data.get('b_text'),
+        "cursor": None, "ok": 0, "fail": 0, "status": "running",
+        "admin_chat_id": q.message.chat_id, "progress_msg_id": q.message.message_id,
+        "heartbeat": datetime.utcnow(), "created_at": datetime.utcnow(),
+    }).inserted_id
+    start_broadcast(context.bot, job_id)
     context.user_data.clear()
     return ConversationHandler.END
 
+# --- Broadcast engine: Mongo-persisted jobs, paced worker pool, resumable ---
+_bc_pool = ThreadPoolExecutor(BROADCAST_WORKERS, thread_name_prefix="bc")
+_bc_running = set()
+_bc_running_lock = threading.Lock()
+
+def start_broadcast(bot, job_id):
+    with _bc_running_lock:
+        if job_id in _bc_running:
+            return
+        _bc_running.add(job_id)
+    threading.Thread(target=run_broadcast, args=(bot, job_id), name=f"bc-{job_id}", daemon=True).start()
+
+def _bc_one(bot, uid: int, files: list, text) -> bool:
+    try:
+        for f in files:
+            send_paced(uid, bot.copy_message, uid, f["chat_id"], f["message_id"])
+        if text:
+            send_paced(uid, bot.send_message, uid, text)
+        return True
+    except Exception as e:
+        log.warning(f"Broadcast to {uid} failed: {e}")
+        return False
+
+def _bc_progress(bot, job: dict, final=False):
+    head = "Done." if final else "Broadcasting…"
+    try:
+        bot.edit_message_text(f"{head} Sent:{job['ok']} Fail:{job['fail']}",
+                              chat_id=job["admin_chat_id"], message_id=job["progress_msg_id"])
+    except Exception as e:
+        log.debug(f"Broadcast progress edit failed: {e}")
+
+# Keeps the lease fresh while a batch is in flight: multi-file sends and flood waits can stall
+# one batch well past BROADCAST_LEASE_SECONDS, and a stale heartbeat means another process resumes it
+def _bc_heartbeat(job_id, stop: threading.Event):
+    while not stop.wait(BROADCAST_HEARTBEAT_SECONDS):
+        try:
+            c_bcjobs.update_one({"_id": job_id, "status": "running"}, {"$set": {"heartbeat": datetime.utcnow()}})
+        except PyMongoError as e:
+            log.warning(f"Broadcast {job_id} heartbeat failed: {e}")
+
+def run_broadcast(bot, job_id):
+    beating = threading.Event()
+    try:
+        job = c_bcjobs.find_one({"_id": job_id})
+        if not job:
+            return
+        threading.Thread(target=_bc_heartbeat, args=(job_id, beating), name=f"bc-hb-{job_id}", daemon=True).start()
+        user_ids = iter_user_ids(after=job["cursor"], batch=BROADCAST_BATCH)
+        last_edit = time.monotonic()
+        while job["status"] == "running":
+            ids = list(islice(user_ids, BROADCAST_BATCH))
+            if not ids:
+                job = c_bcjobs.find_one_and_update({"_id": job_id}, {"$set": {"status": "done"}},
+                                                   return_document=ReturnDocument.AFTER)
+                break
+            sent = list(_bc_pool.map(lambda uid: _bc_one(bot, uid, job["files"], job["text"]), ids))
+            ok = sum(sent)
+            job = c_bcjobs.find_one_and_update(
+                {"_id": job_id},
+                {"$set": {"cursor": ids[-1], "heartbeat": datetime.utcnow()},
+                 "$inc": {"ok": ok, "fail": len(ids) - ok}},
+                return_document=ReturnDocument.AFTER)
+            if time.monotonic() - last_edit >= BROADCAST_PROGRESS_SECONDS:
+                _bc_progress(bot, job); last_edit = time.monotonic()
+        if job["status"] == "done":
+            _bc_progress(bot, job, final=True)
+            try:
+                bot.send_message(job["admin_chat_id"], f"Done. Sent:{job['ok']} Fail:{job['fail']}")
+            except Exception as e:
+                log.warning(f"Broadcast summary failed: {e}")
+    except Exception as e:
+        log.error(f"Broadcast {job_id} stopped: {e}")
+    finally:
+        beating.set()
+        with _bc_running_lock:
+            _bc_running.discard(job_id)
+
+# Picks up running jobs whose worker died (crash/restart); the lease keeps two workers off one job
+def resume_broadcasts(ctx: CallbackContext):
+    while True:
+        now = datetime.utcnow()
+        job = c_bcjobs.find_one_and_update(
+            {"status": "running", "heartbeat": {"$lt": now - timedelta(seconds=BROADCAST_LEASE_SECONDS)}},
+            {"$set": {"heartbeat": now}})
+        if not job:
+            return
+        log.info(f"Resuming broadcast {job['_id']} after user {job['cursor']}")
+        start_broadcast(ctx.bot, job["_id"])
+
 # --- Callback for FS only ---
 def on_cb(update: Update, context: CallbackContext):
     q=update.callback_query; q.answer()
@@ -425,52 +1299,236 @@ def on_cb(update: Update, context: CallbackContext):
         return check_join_cb(update, context)
 
 # --- Channel payment sniffer (PhonePe Business) ---
+notif_seen = LRUCache(10000)
+_notif_lock = threading.Lock()
+
+# True for the first sighting of a notification; redelivered/duplicate posts get False
+def claim_notification(chat_id: int, message_id: int) -> bool:
+    with _notif_lock:
+        if notif_seen.get((chat_id, message_id)):
+            return False
+        notif_seen.put((chat_id, message_id), True)
+    if MULTI_INSTANCE:
+        try:
+            c_notifs.insert_one({"chat_id": chat_id, "message_id": message_id, "created_at": datetime.utcnow()})
+        except DuplicateKeyError:
+            return False
+    return True
+
+# Undoes claim_notification once processing has given up, so a re-forward (or another process) can take it
+def release_notification(chat_id: int, message_id: int):
+    notif_seen.pop((chat_id, message_id))
+    if MULTI_INSTANCE:
+        try:
+            c_notifs.delete_one({"chat_id": chat_id, "message_id": message_id})
+        except PyMongoError as e:
+            log.warning(f"Release notification {message_id} failed: {e}")
+
+# Runs process_payment for a claimed notification. Telegram won't redeliver the post, so a failure
+# (Mongo or Bot API error) is retried from the job queue while we keep the claim, and the claim
+# is only released after PAYMENT_MAX_ATTEMPTS.
+def handle_payment(job_queue, notif: tuple, payee: str, amt: float, ts: datetime, raw: str, attempt: int = 1):
+    try:
+        return process_payment(payee, amt, ts, raw)
+    except Exception as e:
+        if attempt >= PAYMENT_MAX_ATTEMPTS:
+            release_notification(*notif)
+            log.error(f"Payment ₹{amt} ({payee}, post {notif[1]}, {ts:%Y-%m-%d %H:%M:%S}) failed {attempt}x, "
+                      f"giving up; forward the post to the bot to replay it: {e}")
+            return None
+        log.warning(f"Payment post {notif[1]} failed (attempt {attempt}), retrying: {e}")
+        job_queue.run_once(lambda ctx: handle_payment(ctx.job_queue, notif, payee, amt, ts, raw, attempt + 1),
+                           PAYMENT_RETRY_SECONDS * attempt, name=f"payment:{notif[0]}:{notif[1]}")
+        return None
+
+@metrics.timed("handler_seconds", handler="on_channel_post")
 def on_channel_post(update: Update, context: CallbackContext):
     msg = update.channel_post
-    if not msg or msg.chat_id != PAYMENT_NOTIF_CHANNEL_ID:
+    payee = msg and PAYEE_BY_CHANNEL.get(msg.chat_id)
+    if not payee:
         return
+    if msg.date:
+        # post date -> handler entry: Telegram delivery + our queueing, comparable across update modes
+        # (dates have 1s resolution, so read the mean over many posts rather than single samples)
+        metrics.observe("update_lag_seconds", max(0.0, time.time() - msg.date.timestamp()),
+                        mode="webhook" if WEBHOOK_URL else "polling")
     text = msg.text or msg.caption or ""
-    low = text.lower()
-
-    # Require "PhonePe Business" and either "received rs" or "money received"
-    if ("phonepe business" not in low) or (("received rs" not in low) and ("money received" not in low)):
-        return
 
-    amt = parse_phonepe_amount(text)
+    # "PhonePe Business" gate + amount in one pass (see phonepe_parser templates)
+    amt = parse_payment_amount(text)
     if amt is None:
         return
+    if not claim_notification(msg.chat_id, msg.message_id):
+        return
 
     ts = (msg.date or datetime.utcnow()).replace(tzinfo=None)
+    handle_payment(context.job_queue, (msg.chat_id, msg.message_id), payee, amt, ts, text)
+
+# Matches one payment against open sessions, queues the deliveries, logs it; returns orders paid
+def process_payment(payee: str, amt: float, ts: datetime, raw: str) -> int:
     akey = amount_key(amt)
 
-    # optional log
+    # find matching sessions (amount + within window)
+    matches = open_sessions.take(payee, akey, ts)
+    if MULTI_INSTANCE:
+        # sessions opened by other processes aren't in this process's index
+        local = {s["key"] for s in matches}
+        matches += [s for s in c_sessions.find({
+            "payee": payee,
+            "amount_key": akey,
+            "created_at": {"$lte": ts},
+            "hard_expire_at": {"$gte": ts}
+        }) if s["key"] not in local]
+
+    paid = sum(1 for s in matches if claim_session(s, ts))
+    if not paid:
+        # window already closed on our clock (post handled late, restart backlog, admin forward,
+        # or expiry won the race): lapsed sessions still match on the payment's own timestamp
+        paid = sum(1 for s in c_expired.find({
+            "payee": payee,
+            "amount_key": akey,
+            "created_at": {"$lte": ts},
+            "hard_expire_at": {"$gte": ts}
+        }) if claim_session(s, ts))
+
+    # log (buffered); unmatched entries are what /reconcile replays
+    write_behind.add(c_paylog, InsertOne({"payee": payee, "key": akey, "ts": ts, "raw": raw[:500], "matched": paid}))
+    return paid
+
+# exactly one worker wins each session (live or archived); anyone else sees None and skips it
+def claim_session(sess: dict, paid_at: datetime) -> bool:
+    lapsed = "expired_at" in sess
+    if not (c_expired if lapsed else c_sessions).find_one_and_delete({"_id": sess["_id"]}):
+        return False
+    open_sessions.discard(sess)
+    enqueue_delivery(sess, paid_at)
+    record_sale(sess, paid_at)
+    if not lapsed:  # an archived session's lock was released at expiry
+        release_amount_key(sess.get("payee", DEFAULT_PAYEE), sess["amount_key"], sess["hard_expire_at"])
+    return True
+
+# --- Reconciliation: replay logged-but-unmatched payments against open and lapsed sessions ---
+# Range reads (payments log, sessions, expired sessions) and a sorted merge on
+# (payee, amount_key, time), instead of one sessions query per payment.
+def reconcile(since: datetime, until: datetime = None) -> tuple:
+    until = until or datetime.utcnow()
+    write_behind.flush()
+    pays = list(c_paylog.find({"ts": {"$gte": since, "$lte": until}, "matched": {"$in": [0, None]}},
+                              {"payee": 1, "key": 1, "ts": 1}))
+    window = {"created_at": {"$lte": until}, "hard_expire_at": {"$gte": since}}
+    sess = list(c_sessions.find(window)) + list(c_expired.find(window))
+    pays.sort(key=lambda p: (p.get("payee", DEFAULT_PAYEE), p["key"], p["ts"]))
+    sess.sort(key=lambda d: (d.get("payee", DEFAULT_PAYEE), d["amount_key"], d["created_at"]))
+
+    # sessions on one (payee, amount) never overlap in time (the lock is unique, and an archived
+    # session's window is over before its amount is reserved again), so per slot a
+    # single forward-moving pointer finds the session whose window covers each payment
+    matched, j = 0, 0
+    for p in pays:
+        slot = (p.get("payee", DEFAULT_PAYEE), p["key"])
+        while j < len(sess) and ((sess[j].get("payee", DEFAULT_PAYEE), sess[j]["amount_key"]) < slot or
+                                 ((sess[j].get("payee", DEFAULT_PAYEE), sess[j]["amount_key"]) == slot
+                                  and sess[j]["hard_expire_at"] < p["ts"])):
+            j += 1
+        if j == len(sess):
+            break
+        s = sess[j]
+        if (s.get("payee", DEFAULT_PAYEE), s["amount_key"]) != slot or s["created_at"] > p["ts"]:
+            continue
+        if claim_session(s, p["ts"]):
+            matched += 1
+            write_behind.add(c_paylog, UpdateOne({"_id": p["_id"]}, {"$set": {"matched": 1}}))
+        j += 1
+    write_behind.flush()
+    log.info(f"Reconciled {len(pays)} unmatched payments since {since:%Y-%m-%d %H:%M}: {matched} matched")
+    return len(pays), matched
+
+def cmd_reconcile(update: Update, context: CallbackContext):
+    try:
+        minutes = int(context.args[0]) if context.args else RECONCILE_DEFAULT_MINUTES
+    except ValueError:
+        return update.message.reply_text("Usage: /reconcile [minutes]")
+    seen, matched = reconcile(datetime.utcnow() - timedelta(minutes=minutes))
+    update.message.reply_text(f"Replayed {seen} unmatched payments from the last {minutes} min. Matched: {matched}")
+
+# Admin forwards a PhonePe post the bot missed (e.g. sent while it was down) -> replay it
+def on_forwarded_payment(update: Update, context: CallbackContext):
+    msg = update.message
+    src = msg.forward_from_chat
+    payee = src and PAYEE_BY_CHANNEL.get(src.id)
+    if not payee:
+        return
+    amt = parse_payment_amount(msg.text or msg.caption or "")
+    if amt is None:
+        return msg.reply_text("Not a PhonePe payment notification.")
+    if not claim_notification(src.id, msg.forward_from_message_id):
+        return msg.reply_text("Already processed.")
+    ts = (msg.forward_date or msg.date).replace(tzinfo=None)
     try:
-        c_paylog.insert_one({"key": akey, "ts": ts, "raw": text[:500]})
+        paid = process_payment(payee, amt, ts, msg.text or msg.caption or "")
     except Exception:
-        pass
-
-    # find matching sessions (amount + within window)
-    matches = list(c_sessions.find({
-        "amount_key": akey,
-        "created_at": {"$lte": ts},
-        "hard_expire_at": {"$gte": ts}
-    }))
-
-    for s in matches:
-        try:
-            context.bot.send_message(s["chat_id"], "✅ Payment received. Delivering your files…")
-        except Exception as e:
-            log.warning(f"Notify user fail: {e}")
-        deliver(context, s["user_id"], s["item_id"])
-        # cleanup session + release lock
-        c_sessions.delete_one({"_id": s["_id"]})
-        release_amount_key(akey)
+        release_notification(src.id, msg.forward_from_message_id)
+        msg.reply_text("⚠️ Processing failed. Forward it again in a moment.")
+        raise
+    msg.reply_text(f"✅ Matched {paid} order(s)." if paid else "No open or recently expired order for that amount and time.")
+
+# --- Metrics wiring ---
+# Every Bot API call goes through Request.post(url, ...); time it per method
+class TimedRequest(Request):
+    def post(self, url, *a, **k):
+        with metrics.timer("bot_api_seconds", method=url.rsplit("/", 1)[-1]):
+            return super().post(url, *a, **k)
+
+def _reserved_locks() -> int:
+    return c_locks.count_documents({"hard_expire_at": {"$gte": datetime.utcnow()}})
+
+def _decimal_fallback_ratio() -> float:
+    ints = metrics.counter_value("allocator_picks_total", kind="integer")
+    decs = metrics.counter_value("allocator_picks_total", kind="decimal")
+    return decs / (ints + decs) if ints + decs else 0.0
+
+def start_metrics():
+    metrics.SLOW_OP_SECONDS = None if SLOW_OP_MS is None else SLOW_OP_MS / 1000
+    metrics.gauge("open_sessions", lambda: len(open_sessions))
+    metrics.gauge("reserved_locks", _reserved_locks)
+    metrics.gauge("allocator_decimal_fallback_ratio", _decimal_fallback_ratio)
+    metrics.gauge("delivery_queue_depth", lambda: c_delivs.count_documents({"status": "queued"}))
+    if METRICS_PORT:
+        metrics.serve(METRICS_LISTEN, METRICS_PORT)
 
 # --- Admin toggles / stats ---
+def _money(x: float) -> str:
+    return f"₹{x:,.0f}" if abs(x - round(x)) < 1e-9 else f"₹{x:,.2f}"
+
 def stats(update: Update, context: CallbackContext):
-    users = c_users.count_documents({})
-    sessions = c_sessions.count_documents({})
-    update.message.reply_text(f"Users: {users}\nPending sessions: {sessions}")
+    # collection metadata count, not a scan; sessions from the in-memory index
+    users = c_users.estimated_document_count()
+    sessions = c_sessions.estimated_document_count() if MULTI_INSTANCE else len(open_sessions)
+
+    today = datetime.utcnow()
+    days = [_day_id(today - timedelta(days=i)) for i in range(7)]
+    docs = {d["_id"]: d for d in c_stats.find({"_id": {"$in": ["totals"] + days}})}
+    total = docs.get("totals", {})
+    day = docs.get(days[0], {})
+    week = [docs[d] for d in days if d in docs]
+
+    lines = [
+        f"Users: ~{users}",
+        f"Pending sessions: {sessions}",
+        f"Queued deliveries: {c_delivs.count_documents({'status': 'queued'})}",
+        "",
+        f"Today (UTC): {day.get('sales', 0)} sales, {_money(day.get('revenue', 0))}",
+        f"Last 7 days: {sum(d.get('sales', 0) for d in week)} sales, {_money(sum(d.get('revenue', 0) for d in week))}",
+        f"All time: {total.get('sales', 0)} sales, {_money(total.get('revenue', 0))}",
+    ]
+    if day.get("p2d_count"):
+        lines.append(f"Avg payment→delivery today: {day['p2d_sum'] / day['p2d_count']:.1f}s")
+    top = sorted(day.get("items", {}).items(), key=lambda kv: -kv[1].get("revenue", 0))[:5]
+    if top:
+        lines.append("")
+        lines.append("Top today:")
+        lines += [f"• {item}: {v.get('sales', 0)} sold, {_money(v.get('revenue', 0))}" for item, v in top]
+    update.message.reply_text("\n".join(lines))
 
 def protect_on(update: Update, context: CallbackContext):
     global PROTECT_CONTENT_ENABLED
@@ -483,15 +1541,32 @@ def protect_off(update: Update, context: CallbackContext):
     update.message.reply_text("Content protection OFF.")
 
 # ------------ Main ------------
-def main():
-    # Defaults
-    set_cfg("welcome_text", cfg("welcome_text", "Welcome!"))
-    set_cfg("force_sub_text", cfg("force_sub_text", "Join required channels to continue."))
-
-    # Polling (no webhook)
-    os.system(f'curl -s "https://api.telegram.org/bot{TOKEN}/deleteWebhook" >/dev/null')
+# Worker role: no polling/webhook, so Updater.idle() (which only stops a running updater) doesn't fit
+def _run_worker(updater):
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    updater.job_queue.start()
+    log.info("Worker running (deliveries, broadcasts, expiries; no updates)…")
+    while not stop.wait(1):
+        pass
+    updater.job_queue.stop()
 
-    updater = Updater(TOKEN, use_context=True)
+def main():
+    if BOT_ROLE not in ("full", "worker"):
+        sys.exit(f"Unknown BOT_ROLE {BOT_ROLE!r} (full | worker)")
+    if BOT_ROLE == "worker" and not MULTI_INSTANCE:
+        sys.exit("BOT_ROLE=worker needs MULTI_INSTANCE = True (another process takes the updates)")
+    t0 = time.perf_counter()
+    seed_defaults()
+    config_cache.load()
+    config_cache.start_sync()
+    write_behind.start()
+    log.info(f"Loaded {open_sessions.load()} open sessions")
+
+    start_metrics()
+    bot = Bot(TOKEN, request=TimedRequest(con_pool_size=BOT_API_POOL_SIZE))
+    updater = Updater(bot=bot, workers=DISPATCHER_WORKERS, use_context=True)
     dp = updater.dispatcher
     admin = Filters.user(ADMIN_IDS)
 
@@ -525,20 +1600,50 @@ def main():
 
     dp.add_handler(CommandHandler("start", cmd_start))
     dp.add_handler(CommandHandler("stats", stats, filters=admin))
+    dp.add_handler(CommandHandler("reconcile", cmd_reconcile, filters=admin))
     dp.add_handler(CommandHandler("protect_on", protect_on, filters=admin))
     dp.add_handler(CommandHandler("protect_off", protect_off, filters=admin))
 
     dp.add_handler(CallbackQueryHandler(on_cb, pattern="^(check_join)$"))
 
+    # Missed PhonePe posts forwarded by an admin
+    dp.add_handler(MessageHandler(Filters.forwarded & Filters.text & Filters.chat_type.private & admin,
+                                  on_forwarded_payment))
+
     # Channel listener (PhonePe Business)
     dp.add_handler(MessageHandler(
-        Filters.update.channel_post & Filters.chat(PAYMENT_NOTIF_CHANNEL_ID) & Filters.text,
+        Filters.update.channel_post & Filters.chat(list(PAYEE_BY_CHANNEL)) & Filters.text,
         on_channel_post
     ))
 
-    log.info("Bot running…")
-    updater.start_polling()
+    start_delivery_workers(updater.bot)
+    log.info(f"Archived {archive_lapsed_sessions()} sessions that lapsed while down")
+    # catch up first: payments logged but never matched, then give Telegram's backlog of
+    # pending channel posts STARTUP_CATCHUP_SECONDS before expiring sessions that lapsed while down
+    reconcile(datetime.utcnow() - timedelta(minutes=RECONCILE_STARTUP_MINUTES))
+    catchup = datetime.utcnow() + timedelta(seconds=STARTUP_CATCHUP_SECONDS)
+    for sess in open_sessions.all():
+        schedule_expiry(updater.job_queue, sess, not_before=catchup)
+    updater.job_queue.run_repeating(resume_broadcasts, interval=BROADCAST_LEASE_SECONDS, first=5)
+
+    if BOT_ROLE == "worker":
+        log.info(f"Startup took {(time.perf_counter() - t0) * 1000:.0f} ms")
+        _run_worker(updater)
+        return write_behind.stop()
+    if WEBHOOK_URL:
+        url_path = f"{WEBHOOK_PATH}/{WEBHOOK_SECRET}" if WEBHOOK_SECRET else WEBHOOK_PATH
+        updater.start_webhook(listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url_path=url_path,
+                              webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{url_path}")
+        log.info(f"Bot running (webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}/…)")
+    else:
+        updater.start_polling()  # bootstrap deletes any webhook left set
+        log.info("Bot running (polling)…")
+    log.info(f"Startup took {(time.perf_counter() - t0) * 1000:.0f} ms")
     updater.idle()
+    write_behind.stop()
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+    else:
+        main()
@@ -0,0 +1,164 @@
+# metrics.py — in-process counters, latency histograms and gauges for the UPI bot
+# - inc() / observe() / timer() / timed() record; gauge() registers a callback read at scrape time
+# - serve() exposes everything in Prometheus text format on a local HTTP port (/metrics)
+# - SLOW_OP_SECONDS: any timed operation at least this slow is also logged (None = off)
+# - MongoCommandMetrics: pymongo command listener, times every round trip per collection + command
+
+import time, threading, logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pymongo import monitoring
+
+log = logging.getLogger("upi-mongo-bot.metrics")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SLOW_OP_SECONDS = None
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_hists = {}       # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+_gauges = {}      # name -> fn() returning a number
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name: str, seconds: float, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        h = _hists.get(key)
+        if h is None:
+            h = _hists[key] = [0] * (len(BUCKETS) + 2)
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                h[i] += 1
+                break
+        else:
+            h[len(BUCKETS)] += 1
+        h[-1] += seconds
+    if SLOW_OP_SECONDS is not None and seconds >= SLOW_OP_SECONDS:
+        log.warning(f"Slow {name} {labels}: {seconds * 1000:.0f} ms")
+
+def gauge(name: str, fn):
+    _gauges[name] = fn
+
+def counter_value(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get((name, _labels(labels)), 0)
+
+class timer:
+    # with timer("x_seconds", op="y"): ...   — failures also count into x_errors_total
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.t0, **self.labels)
+        if exc_type is not None:
+            inc(self.name.rsplit("_seconds", 1)[0] + "_errors_total", **self.labels)
+        return False
+
+def timed(name: str, **labels):
+    def deco(fn):
+        def wrapper(*a, **k):
+            with timer(name, **labels):
+                return fn(*a, **k)
+        wrapper.__name__ = fn.__name__
+        wrapper.__wrapped__ = fn
+        return wrapper
+    return deco
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    # one sample per server round trip (find + each getMore, bulk batches, …)
+    def __init__(self):
+        self._pending = {}
+        self._plock = threading.Lock()
+
+    def started(self, event):
+        coll = event.command.get(event.command_name)
+        if not isinstance(coll, str):
+            coll = event.command.get("collection", "")  # getMore carries the cursor id instead
+        with self._plock:
+            self._pending[(event.connection_id, event.request_id)] = coll
+
+    def _done(self, event, failed: bool):
+        with self._plock:
+            coll = self._pending.pop((event.connection_id, event.request_id), "")
+        observe("mongo_op_seconds", event.duration_micros / 1e6, collection=coll, op=event.command_name)
+        if failed:
+            inc("mongo_op_errors_total", collection=coll, op=event.command_name)
+
+    def succeeded(self, event):
+        self._done(event, False)
+
+    def failed(self, event):
+        self._done(event, True)
+
+def _fmt(name: str, labels: tuple, value, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return f"{name} {value}"
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return f"{name}{{{inner}}} {value}"
+
+def render() -> str:
+    out = []
+    with _lock:
+        counters = sorted(_counters.items())
+        hists = sorted((k, list(v)) for k, v in _hists.items())
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            out.append(f"# TYPE {name} counter")
+            seen.add(name)
+        out.append(_fmt(name, labels, value))
+    for (name, labels), h in hists:
+        if name not in seen:
+            out.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cum = 0
+        for b, n in zip(BUCKETS, h):
+            cum += n
+            out.append(_fmt(f"{name}_bucket", labels, cum, (("le", b),)))
+        cum += h[len(BUCKETS)]
+        out.append(_fmt(f"{name}_bucket", labels, cum, (("le", "+Inf"),)))
+        out.append(_fmt(f"{name}_sum", labels, round(h[-1], 6)))
+        out.append(_fmt(f"{name}_count", labels, cum))
+    for name, fn in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception as e:
+            log.warning(f"Gauge {name} failed: {e}")
+            continue
+        out.append(f"# TYPE {name} gauge")
+        out.append(_fmt(name, (), value))
+    return "\n".join(out) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a):
+        pass
+
+def serve(host: str, port: int):
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    log.info(f"Metrics on http://{host}:{port}/metrics")
+    return httpd
@@ -0,0 +1,71 @@
+# phonepe_parser.py — payment-notification parsing for the UPI bot
+# - One str.translate pass: any Unicode digit (𝟙, ١, １, keycap 1️⃣) -> ASCII,
+#   combining marks (keycap enclosure, variation selectors) dropped
+# - One regex per template: the sender gate and the amount come out of a single match
+# - Templates are pluggable (register_template) for other notification formats
+
+import re, unicodedata
+
+class _DigitTable(dict):
+    # str.translate table: ASCII is precomputed, any other code point is
+    # classified on first sight and memoized, so each message is a single C-level pass
+    def __missing__(self, cp):
+        ch = chr(cp)
+        if unicodedata.category(ch).startswith('M'):
+            out = None
+        elif ch.isdigit():
+            try:
+                out = ord(str(unicodedata.digit(ch)))
+            except ValueError:
+                out = cp
+        else:
+            out = cp
+        self[cp] = out
+        return out
+
+DIGIT_TABLE = _DigitTable((cp, cp) for cp in range(128))
+
+def normalize_digits(s: str) -> str:
+    return s.translate(DIGIT_TABLE)
+
+class Template:
+    # gate and amount are regex fragments matched against normalized, lowercased text;
+    # amount must capture the number in group 1
+    def __init__(self, name: str, gate: str, amount: str):
+        self.name = name
+        self.regex = re.compile(rf"(?=.*?{gate}).*?{amount}", re.S)
+
+    def match(self, low: str):
+        m = self.regex.match(low)
+        if not m:
+            return None
+        try:
+            return float(m.group(1).replace(",", ""))
+        except ValueError:
+            return None
+
+_AMOUNT = r"\s*[.:₹\s]*([0-9][0-9,]*(?:\.[0-9]{1,2})?)"
+
+TEMPLATES = [
+    # PhonePe Business: "Received Rs 11", "Received Rs.11", "You've received Rs 1,250.50", "Money received …"
+    Template("phonepe_business", r"phonepe business", r"(?:received\s*rs|you['’]ve\s*received\s*rs)" + _AMOUNT),
+]
+
+def register_template(tpl: Template, first: bool = False):
+    if first:
+        TEMPLATES.insert(0, tpl)
+    else:
+        TEMPLATES.append(tpl)
+
+# (template name, amount) for the first template that matches, else None
+def match_notification(text: str):
+    low = normalize_digits(text or "").lower()
+    for tpl in TEMPLATES:
+        amt = tpl.match(low)
+        if amt is not None:
+            return tpl.name, amt
+    return None
+
+def parse_payment_amount(text: str):
+    hit = match_notification(text)
+    return hit[1] if hit else None